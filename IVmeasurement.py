@@ -17,23 +17,14 @@ k.setSourceSweep('voltage', minV, maxV, sourceStepV, sourceStepT)
 k.doMeasurement()
 k.saveData('/users/henry/pythonData/', 'IVmeasurement.txt')
 
-# to sweep from minV to maxV back to minV
-k.setSourceSweep('voltage', minV, maxV, sourceStepV, sourceStepT)  # sweep from minV to maxV
-k._startMeasurement()
-k._pullData()
-k.setSourceSweep('voltage', maxV, minV, -sourceStepV, sourceStepT)  # sweep from maxV to minV
-k._startMeasurement()
-k._pullData()
+# to sweep from minV to maxV back to minV, with both legs run from a single trigger
+k._clearData()
+k.doLegSweep('voltage', [(minV, maxV, sourceStepV), (maxV, minV, sourceStepV)], sourceStepT)
 k._stopMeasurement()
 k.saveData('/users/henry/pythonData/', 'IVmeasurement.txt')
 
 # to ramp the applied voltage up slowly, instead of as a step function
 k.rampOutputOn(minV, sourceStepV)
-k.setSourceSweep('voltage', minV, maxV, sourceStepV, sourceStepT)  # sweep from minV to maxV
-k._startMeasurement()
-k._pullData()
-k.setSourceSweep('voltage', maxV, minV, -sourceStepV, sourceStepT)  # sweep from maxV to minV
-k._startMeasurement()
-k._pullData()
+k.doLegSweep('voltage', [(minV, maxV, sourceStepV), (maxV, minV, sourceStepV)], sourceStepT)
 k.rampOutputOff(minV, sourceStepV)
 k._stopMeasurement()
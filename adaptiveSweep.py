@@ -0,0 +1,125 @@
+# sweeps that only take closely spaced points where the curve changes, i.e.
+# >>> k = Keithley2400(23)
+# >>> k.setMeasure('current')
+# >>> result = adaptiveSweep(k, 'voltage', -5E-3, 5E-3, coarseStep=5E-4, minStep=1E-5)
+# >>> result.rows  # one (V, I, I/V, time, ?) row per reading, sorted by source value
+# >>> k.saveData(savePath, 'adaptive.txt')  # k.buffer holds the merged readings too
+#
+# a coarse sweep is taken first, then every interval where the measured value changes by more than
+# tolerance (as a fraction of its whole range), or where the slope bends by that much across it, is split
+# into subdivisions and only those points are measured, as one list sweep per pass.
+# this repeats until nothing is left to refine or the intervals are down to minStep.
+# assumes the curve is single valued, i.e. no hysteresis; noisy curves need a tolerance above the noise
+
+from __future__ import print_function
+
+import time
+
+import numpy
+
+from keithley import sweepPoints, DEFAULT_TIME_STEP
+
+DEFAULT_TOLERANCE = 0.02  # fraction of the measured range
+DEFAULT_SUBDIVISIONS = 4  # pieces each interval that needs refining is split into
+DEFAULT_MAX_PASSES = 6
+
+
+# source values that refine the intervals of the sorted points (x, y) that aren't resolved to tolerance
+# an interval is refined if y changes by more than tolerance * the range of y across it, or if the slope
+# changes by that much over its width at either end; intervals are never split below minStep
+def refineIntervals(x, y, tolerance=DEFAULT_TOLERANCE, minStep=0, subdivisions=DEFAULT_SUBDIVISIONS):
+    x, y = numpy.asarray(x, dtype=float), numpy.asarray(y, dtype=float)
+    if len(x) < 2:
+        return numpy.empty(0)
+    widths = numpy.diff(x)
+    changes = numpy.diff(y)
+    span = numpy.ptp(y[numpy.isfinite(y)]) if numpy.isfinite(y).any() else 0
+    if span == 0:
+        return numpy.empty(0)
+    limit = tolerance * span
+
+    # dI/dV on each interval and how much it bends at each end
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        slopes = changes / widths
+    bends = numpy.abs(numpy.diff(slopes))
+    bend = numpy.zeros(len(widths))
+    bend[1:] = bends
+    bend[:-1] = numpy.maximum(bend[:-1], bends)
+
+    refine = (numpy.abs(changes) > limit) | (bend * widths > limit)
+    refine &= widths >= 2 * minStep
+    refine &= numpy.isfinite(changes)
+    if not refine.any():
+        return numpy.empty(0)
+
+    # split each interval into as many pieces as allowed, up to subdivisions
+    pieces = numpy.minimum(subdivisions, numpy.floor(widths / max(minStep, 1E-300) + 1E-9)).astype(int)
+    newValues = [x[i] + widths[i] * numpy.arange(1, pieces[i]) / float(pieces[i])
+                 for i in numpy.nonzero(refine)[0] if pieces[i] > 1]
+    if not newValues:
+        return numpy.empty(0)
+    return numpy.concatenate(newValues)
+
+
+class AdaptiveResult(object):
+    """The merged readings of an adaptive sweep and how they were taken"""
+
+    def __init__(self, rows, passes, seconds, fixedPoints):
+        self.rows = rows  # one (V, I, I/V, time, ?) row per reading, sorted by source value
+        self.passes = passes  # readings taken in each pass, the coarse sweep first
+        self.seconds = seconds
+        self.fixedPoints = fixedPoints  # readings a fixed step sweep at the finest step taken would need
+
+    @property
+    def numPoints(self):
+        return len(self.rows)
+
+
+# measure values as a list sweep, returns the new rows
+def _measureList(keithley, source, values, timeStep):
+    first = len(keithley.buffer)
+    keithley.doListSweep(source, values, timeStep)
+    return keithley.buffer.rows()[first:].copy()
+
+
+# an adaptive sweep on keithley from startValue to stopValue, see above
+# source is 'voltage' or 'current'; the measured value is the current or voltage respectively
+# the merged, sorted readings replace whatever was in keithley.buffer
+def adaptiveSweep(keithley, source, startValue, stopValue, coarseStep, minStep=None, tolerance=DEFAULT_TOLERANCE,
+                  subdivisions=DEFAULT_SUBDIVISIONS, maxPasses=DEFAULT_MAX_PASSES, timeStep=DEFAULT_TIME_STEP):
+    if minStep is None:
+        minStep = abs(coarseStep) / subdivisions ** (maxPasses - 1)
+    yColumn = 1 if source.lower() == 'voltage' else 0
+    startTime = time.time()
+
+    keithley._clearData()
+    numPts = sweepPoints(startValue, stopValue, coarseStep)
+    values = numpy.linspace(startValue, stopValue, numPts)
+    rows = _measureList(keithley, source, list(values), timeStep)
+    passes = [len(rows)]
+    while len(passes) < maxPasses:
+        # refine on the source values asked for, the measured ones have noise
+        order = numpy.argsort(values, kind='mergesort')
+        values, rows = values[order], rows[order]
+        newValues = refineIntervals(values, rows[:, yColumn], tolerance, minStep, subdivisions)
+        if not len(newValues):
+            break
+        # run the new points in the direction of the sweep
+        newValues = numpy.sort(newValues)
+        if stopValue < startValue:
+            newValues = newValues[::-1]
+        newRows = _measureList(keithley, source, list(newValues), timeStep)
+        values = numpy.concatenate((values, newValues))
+        rows = numpy.concatenate((rows, newRows))
+        passes.append(len(newRows))
+    keithley._stopMeasurement()
+
+    order = numpy.argsort(values, kind='mergesort')
+    if stopValue < startValue:
+        order = order[::-1]
+    rows = rows[order]
+    keithley._clearData()
+    keithley.buffer.append(rows)
+
+    finestStep = numpy.min(numpy.abs(numpy.diff(values[order]))) if len(values) > 1 else abs(coarseStep)
+    return AdaptiveResult(rows, passes, time.time() - startTime, sweepPoints(startValue, stopValue, finestStep))
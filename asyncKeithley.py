@@ -0,0 +1,149 @@
+# asyncio versions of the Keithley2400 operations and of the gateSweep and ivSweep flows, so that
+# several Keithleys can be started, waited on and read out at the same time, i.e.
+# >>> import asyncio
+# >>> from gateSweep import gateSweep
+# >>> from asyncKeithley import doTLINKSweep
+# >>> gs = gateSweep()
+# >>> asyncio.get_event_loop().run_until_complete(doTLINKSweep(gs))
+#
+# needs python 3.5 or later. The blocking VISA calls for each Keithley run in a worker thread of
+# its own, so each Keithley's transactions stay in order while the other Keithleys carry on.
+
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from keithley import legValues
+from gateSweep import DEFAULT_V_GATE_RAMP_STEP, DEFAULT_SD_RAMP_STEP
+
+
+class AsyncKeithley2400(object):
+    """Awaitable versions of the operations of one Keithley2400"""
+
+    def __init__(self, keithley):
+        self.keithley = keithley
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    # run keithley.method(*args, **kwargs) in this Keithley's worker thread
+    async def call(self, method, *args, **kwargs):
+        return await self.run(getattr(self.keithley, method), *args, **kwargs)
+
+    # run function(*args, **kwargs) in this Keithley's worker thread, for anything else that talks to it
+    async def run(self, function, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    # configure the Keithley, e.g. await k.configure('setSourceSweep', 'voltage', 0, 1, 0.1)
+    async def configure(self, method, *args, **kwargs):
+        return await self.call(method, *args, **kwargs)
+
+    # start a measurement w/o waiting for it to finish
+    async def start(self):
+        await self.call('_startNoWait')
+
+    # wait for the 'measurement is done' signal from the Keithley
+    # if it doesn't come within timeout seconds the transport's timeout error is raised
+    async def waitForSRQ(self, timeout=None):
+        await self.call('_catchSRQ', timeout)
+
+    # pull the measured data from the Keithley
+    async def pull(self):
+        return await self.call('_pullData')
+
+    async def stop(self):
+        await self.call('_stopMeasurement')
+
+    # start a measurement, wait for it to finish and pull the data
+    async def measure(self, timeout=None):
+        await self.start()
+        await self.waitForSRQ(timeout)
+        return await self.pull()
+
+    def close(self):
+        self.executor.shutdown()
+
+    # with AsyncKeithley2400(k) as ak: closes the worker thread at the end of the block
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# gateSweep.doTLINKSweep, with the two Keithleys waited on and read out at the same time
+async def doTLINKSweep(gs, timeout=None):
+    with AsyncKeithley2400(gs.gateKeithley) as gate, AsyncKeithley2400(gs.sdKeithley) as sd:
+        gs.data = [[], [], [], []]  # time, V_gate, I_sd, I_gate
+        gs.sdKeithley._clearData()
+        gs.gateKeithley._clearData()
+
+        # ramp one at a time, in the same order as gateSweep does
+        await gate.call('rampOutputOn', gs.VgateStart, DEFAULT_V_GATE_RAMP_STEP)
+        await sd.call('rampOutputOn', gs.sdBias, DEFAULT_SD_RAMP_STEP)
+        try:
+            # set up the Keithleys to use TLINK triggering
+            await asyncio.gather(sd.configure('setTLINK', 'SOURCE', 'SENSE'),
+                                 gate.configure('setTLINK', 'SOURCE', 'SENSE'))
+
+            for start, stop, step in gs._TLINKLegs():
+                numPts = await gate.configure('setSourceSweep', 'voltage', start, stop, step, gs.gateDelay)
+                await sd.configure('setNumPoints', numPts)
+
+                await gate.start()
+                await sd.start()
+                await asyncio.gather(gate.waitForSRQ(timeout), sd.waitForSRQ(timeout))
+                await asyncio.gather(gate.pull(), sd.pull())
+        finally:
+            # turn everything off, also if the sweep failed or was cancelled
+            # after a sweep the gate is back at its DC level, VgateStart
+            await sd.call('rampOutputOff', gs.sdBias, DEFAULT_SD_RAMP_STEP)
+            await gate.call('rampOutputOff', gs.VgateStart, DEFAULT_V_GATE_RAMP_STEP)
+            await asyncio.gather(sd.stop(), gate.stop())
+            # set up the Keithleys to stop using TLINK triggering
+            await asyncio.gather(sd.configure('setNoTLINK'), gate.configure('setNoTLINK'))
+        gs._finishTLINKSweep()
+
+
+# gateSweep.doSweep, with the two Keithleys measuring each gate point at the same time
+async def doSweep(gs, timeout=None):
+    with AsyncKeithley2400(gs.gateKeithley) as gate, AsyncKeithley2400(gs.sdKeithley) as sd:
+        gs.data = [[], [], [], []]  # time, V_gate, I_sd, I_gate
+
+        gs.Vgate = await gate.call('rampOutputOn', gs.VgateStart, DEFAULT_V_GATE_RAMP_STEP)
+        await sd.call('rampOutputOn', gs.sdBias, gs.sdBias / 20)
+        # average on the source-drain Keithley, like gateSweep.doSweep
+        await sd.run(gs._startAveraging)
+        try:
+            startTime = time.time()
+            # ramp the gate voltage up while taking data, then back down
+            for direction in (1, -1):
+                while (gs.Vgate < gs.VgateStop) if direction == 1 else (gs.Vgate > gs.VgateStart):
+                    gs.data[0].append(time.time() - startTime)
+
+                    await asyncio.gather(sd.measure(timeout), gate.measure(timeout))
+                    await sd.call('write', "TRACE:CLEAR")
+
+                    gs._recordPoint()
+
+                    gs.Vgate += direction * gs.VgateStep
+                    await gate.configure('setSourceDC', 'voltage', gs.Vgate)
+        finally:
+            # from wherever the gate got to, also if the sweep failed or was cancelled
+            await sd.call('rampOutputOff', gs.sdBias, gs.sdBias / 20)
+            await gate.call('rampOutputOff', gs.Vgate, DEFAULT_V_GATE_RAMP_STEP)
+            await sd.run(gs._stopAveraging)
+
+
+# ivSweep.doSweep, awaitable so that sweeps on several Keithleys can run at once, e.g.
+# >>> loop.run_until_complete(asyncio.gather(doIVSweep(iv1), doIVSweep(iv2)))
+async def doIVSweep(iv, timeout=None):
+    with AsyncKeithley2400(iv.k) as k:
+        await k.call('rampOutputOn', iv.minBias, iv.stepBias)
+        try:
+            # both legs run from a single trigger, like Keithley2400.doLegSweep
+            await k.call('doListSweep', 'voltage', legValues(iv.legs()), iv.stepTime, timeout=timeout)
+        finally:
+            # from the DC level, which doListSweep moves along to the end of each piece: minBias at the end
+            await k.call('rampOutputOff', iv.k.getSource()[1], iv.stepBias)
+            await k.stop()
@@ -0,0 +1,136 @@
+# a worker thread for saving data files and plots, so that the next sweep doesn't wait on the disk, i.e.
+# >>> writer = defaultWriter()
+# >>> job = writer.submit(saveFunction, arg1, arg2)  # returns straight away
+# >>> job.result()  # waits for saveFunction(arg1, arg2) to finish, raises if it failed
+#
+# at most maxPending jobs are queued, submit() waits for room after that so a slow disk slows the sweeps
+# down rather than using up memory; anything still queued is written before the interpreter exits
+# jobs run one at a time in the order they were submitted
+# at exit every writer is flushed first and then the atShutdown() hooks run, e.g. closing the plot render pool
+# that queued savePlot jobs still need
+
+from __future__ import print_function
+
+import atexit
+import threading
+import traceback
+
+try:
+    from Queue import Queue  # python 2
+except ImportError:
+    from queue import Queue
+
+DEFAULT_MAX_PENDING = 8  # jobs queued before submit() blocks
+
+_defaultWriter = None
+_defaultWriterLock = threading.Lock()
+_writers = []
+_shutdownHooks = []
+
+
+# run function at exit, after every writer has finished its queued jobs
+# atexit runs the last registered first, so the shutdown is registered again to go before anything already
+# registered, e.g. multiprocessing terminating a pool the queued jobs still need
+def atShutdown(function):
+    _shutdownHooks.append(function)
+    atexit.register(_shutdown)
+
+
+# flush the writers then run the hooks, only does anything the first time
+def _shutdown():
+    for writer in list(_writers):
+        writer.flush()
+    while _shutdownHooks:
+        _shutdownHooks.pop()()
+
+
+atexit.register(_shutdown)
+
+
+# the writer shared by everything in this process, started the first time it is needed
+def defaultWriter():
+    global _defaultWriter
+    with _defaultWriterLock:
+        if _defaultWriter is None:
+            _defaultWriter = BackgroundWriter()
+        return _defaultWriter
+
+
+class WriteJob(object):
+    """The pending result of a job submitted to a BackgroundWriter"""
+
+    def __init__(self, function, args, kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self._done = threading.Event()
+        self._result = None
+        self._exception = None
+
+    def _run(self):
+        try:
+            self._result = self.function(*self.args, **self.kwargs)
+        except Exception as e:
+            self._exception = e
+            print("background save failed:")
+            traceback.print_exc()
+        finally:
+            self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    # wait for the job to finish and return what it returned, re-raising its exception if it failed
+    def result(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise RuntimeError("background save still running after " + str(timeout) + " s")
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        self._done.wait(timeout)
+        return self._exception
+
+
+class BackgroundWriter(object):
+    """Runs save jobs on a worker thread, in order, with a bounded backlog"""
+
+    def __init__(self, maxPending=DEFAULT_MAX_PENDING):
+        self.queue = Queue(maxPending)
+        self.thread = threading.Thread(target=self._work, name='BackgroundWriter')
+        self.thread.daemon = True
+        self.thread.start()
+        _writers.append(self)
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                job._run()
+            finally:
+                self.queue.task_done()
+
+    # queue function(*args, **kwargs), blocks while maxPending jobs are already waiting
+    # the job mustn't use anything the caller will change afterwards, hand it a copy of the data
+    def submit(self, function, *args, **kwargs):
+        if not self.thread.is_alive():
+            raise RuntimeError("background writer is closed")
+        job = WriteJob(function, args, kwargs)
+        self.queue.put(job)
+        return job
+
+    # wait until every job submitted so far has finished
+    def flush(self):
+        if self.thread.is_alive():
+            self.queue.join()
+
+    # finish the queued jobs then stop the worker thread
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self in _writers:
+            _writers.remove(self)
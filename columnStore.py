@@ -0,0 +1,174 @@
+# binary columnar storage for measurement data, an alternative to the fixed-width text files
+# a store is a directory holding one raw little-endian float64 file per column plus a JSON sidecar
+# (meta.json) with the column names, units, settings and where each appended sweep starts, i.e.
+# >>> w = ColumnWriter('C:/Data/run0001.cols', ['t', 'V', 'I'], units=['s', 'volts', 'amps'])
+# >>> w.append([t, V, I], settings={'bias': 5E-3})  # one call per sweep
+# >>> r = ColumnReader('C:/Data/run0001.cols')
+# >>> r['V'][:10], r.sweep(0)['I']
+#
+# the sidecar is rewritten after the column data, so a store interrupted mid-append still opens
+# with the sweeps it had before; the new sidecar replaces the old one in a single rename, and if a crash
+# leaves only meta.json.tmp it is picked up from there
+
+import json
+import os
+
+import numpy
+
+DTYPE = '<f8'
+META_FILE = 'meta.json'
+COLUMN_EXTENSION = '.f8'
+STORE_EXTENSION = '.cols'
+
+
+def _columnFile(path, name):
+    return os.path.join(path, name + COLUMN_EXTENSION)
+
+
+# rename source to target, replacing it in one step
+# python 2 has no os.replace, and its os.rename won't replace an existing file on windows
+def _replace(source, target):
+    if hasattr(os, 'replace'):
+        os.replace(source, target)
+        return
+    try:
+        os.rename(source, target)
+    except OSError:
+        os.remove(target)
+        os.rename(source, target)
+
+
+# put a complete meta.json.tmp in place if meta.json is missing, i.e. a crash between removing and renaming
+def _recoverMeta(path):
+    metaPath = os.path.join(path, META_FILE)
+    if os.path.exists(metaPath) or not os.path.exists(metaPath + '.tmp'):
+        return
+    try:
+        with open(metaPath + '.tmp') as metaFile:
+            json.load(metaFile)
+    except ValueError:
+        return  # cut off while it was being written, there was no store yet
+    _replace(metaPath + '.tmp', metaPath)
+
+
+# whether there is a store at path
+def storeExists(path):
+    _recoverMeta(path)
+    return os.path.exists(os.path.join(path, META_FILE))
+
+
+def _readMeta(path):
+    _recoverMeta(path)
+    with open(os.path.join(path, META_FILE)) as metaFile:
+        return json.load(metaFile)
+
+
+# write the sidecar to a temporary file first so a reader never sees half of it
+def _writeMeta(path, meta):
+    metaPath = os.path.join(path, META_FILE)
+    with open(metaPath + '.tmp', 'w') as metaFile:
+        json.dump(meta, metaFile, indent=1)
+        metaFile.flush()
+        os.fsync(metaFile.fileno())
+    _replace(metaPath + '.tmp', metaPath)
+
+
+class ColumnWriter(object):
+    """Appends sweeps of equal length columns to a column store, creating it if needed"""
+
+    # columns is a list of column names, units a list of the same length
+    # settings is stored once for the whole store, e.g. the instrument configuration
+    def __init__(self, path, columns, units=None, settings=None):
+        self.path = path
+        if storeExists(path):
+            self.meta = _readMeta(path)
+            if self.meta['columns'] != list(columns):
+                raise ValueError("store " + path + " has columns " + str(self.meta['columns']))
+            # drop anything written after the last complete sweep
+            for name in self.meta['columns']:
+                with open(_columnFile(path, name), 'r+b') as columnFile:
+                    columnFile.truncate(self.meta['length'] * numpy.dtype(DTYPE).itemsize)
+        else:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            self.meta = {'columns': list(columns),
+                         'units': list(units) if units is not None else [''] * len(columns),
+                         'dtype': DTYPE,
+                         'length': 0,
+                         'settings': settings or {},
+                         'sweeps': []}
+            # column data w/o a sidecar can't be made sense of, but it isn't thrown away either
+            for name in columns:
+                if os.path.exists(_columnFile(path, name)) and os.path.getsize(_columnFile(path, name)):
+                    raise ValueError("store " + path + " has data in " + name + " but no " + META_FILE)
+            for name in columns:
+                open(_columnFile(path, name), 'ab').close()
+            _writeMeta(path, self.meta)
+
+    # append one sweep, data is a list of columns in the store's order or a dict of name: column
+    # the columns are written as they are, no per row formatting
+    def append(self, data, settings=None):
+        numRows = self._writeColumns(data)
+        self.meta['sweeps'].append({'offset': self.meta['length'], 'length': numRows, 'settings': settings or {}})
+        self.meta['length'] += numRows
+        _writeMeta(self.path, self.meta)
+        return len(self.meta['sweeps']) - 1
+
+    # append rows w/o starting a new sweep, they carry on the last sweep if there is one
+    # for logs written a chunk at a time, the sidecar stays the same size however many chunks there are
+    def extend(self, data):
+        numRows = self._writeColumns(data)
+        if self.meta['sweeps']:
+            self.meta['sweeps'][-1]['length'] += numRows
+        self.meta['length'] += numRows
+        _writeMeta(self.path, self.meta)
+
+    # write the rows of data to the end of the column files, returns the number of rows
+    def _writeColumns(self, data):
+        if isinstance(data, dict):
+            data = [data[name] for name in self.meta['columns']]
+        if len(data) != len(self.meta['columns']):
+            raise ValueError("expected " + str(len(self.meta['columns'])) + " columns, got " + str(len(data)))
+        data = [numpy.ascontiguousarray(column, dtype=DTYPE) for column in data]
+        numRows = len(data[0])
+        if any(len(column) != numRows for column in data):
+            raise ValueError("columns must all be the same length")
+
+        for name, column in zip(self.meta['columns'], data):
+            with open(_columnFile(self.path, name), 'ab') as columnFile:
+                column.tofile(columnFile)
+        return numRows
+
+
+class ColumnReader(object):
+    """Memory-mapped read access to a column store, nothing is read until it is indexed"""
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = _readMeta(path)
+        self.columns = self.meta['columns']
+        self.units = dict(zip(self.columns, self.meta['units']))
+        self.settings = self.meta['settings']
+        self.sweeps = self.meta['sweeps']
+        self._maps = {}
+
+    def __len__(self):
+        return self.meta['length']
+
+    # the whole of one column, as a read-only numpy.memmap
+    def __getitem__(self, name):
+        if name not in self._maps:
+            if name not in self.columns:
+                raise KeyError(name)
+            if self.meta['length'] == 0:
+                self._maps[name] = numpy.empty(0, dtype=self.meta['dtype'])
+            else:
+                self._maps[name] = numpy.memmap(_columnFile(self.path, name), dtype=self.meta['dtype'],
+                                                mode='r', shape=(self.meta['length'],))
+        return self._maps[name]
+
+    # the columns of sweep number i, as a dict of name: memmap slice
+    def sweep(self, i):
+        start = self.sweeps[i]['offset']
+        end = start + self.sweeps[i]['length']
+        return dict((name, self[name][start:end]) for name in self.columns)
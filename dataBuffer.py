@@ -0,0 +1,55 @@
+# growable columnar storage for readings from the Keithley 2400
+# each reading is one row of (V, I, I/V, time, ?) values in a single preallocated numpy array
+
+import numpy
+
+DEFAULT_CAPACITY = 100  # rows to allocate before the size of a measurement is known
+COLUMNS = ('volts', 'amps', 'ohms', 'time', 'status')
+UNITS = ('volts', 'amps', 'ohms', 's', '?')
+NUM_COLUMNS = len(COLUMNS)
+
+
+class DataBuffer(object):
+    """A preallocated, growable numpy array of Keithley readings, one row per reading"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self._array = numpy.empty((capacity, NUM_COLUMNS))
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    # forget all readings, keeping the same capacity
+    # fresh storage is allocated so that views handed out earlier keep their values
+    def clear(self):
+        self._array = numpy.empty(self._array.shape)
+        self.size = 0
+
+    # make room for numRows readings in total
+    def reserve(self, numRows):
+        numRows = int(numRows)
+        if numRows > len(self._array):
+            newArray = numpy.empty((numRows, NUM_COLUMNS))
+            newArray[:self.size] = self._array[:self.size]
+            self._array = newArray
+
+    # append a flat sequence of (V, I, I/V, time, ?) values, returns the new rows
+    def append(self, values):
+        newRows = numpy.asarray(values, dtype=float).reshape(-1, NUM_COLUMNS)
+        end = self.size + len(newRows)
+        if end > len(self._array):
+            # grow geometrically so that repeated single point appends stay cheap
+            self.reserve(max(end, 2 * len(self._array)))
+        self._array[self.size:end] = newRows
+        self.size = end
+        return self._array[end - len(newRows):end]
+
+    # all readings so far, one row per reading (a view, not a copy)
+    def rows(self):
+        return self._array[:self.size]
+
+    # a single column of the readings so far, by name or index (a view, not a copy)
+    def column(self, name):
+        if name in COLUMNS:
+            name = COLUMNS.index(name)
+        return self._array[:self.size, name]
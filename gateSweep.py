@@ -4,8 +4,11 @@
 # >>> gs = gateSweep()
 # >>> gs.doSweep()
 
+from __future__ import print_function
+
 DEFAULT_SAVE_PATH = 'C:/Data/'
 DEFAULT_SAVE_FILE = 'gateSweep_.txt'
+DEFAULT_FILE_FORMAT = 'text'  # 'text' for Origin-style text, 'columns' for a binary column store (see columnStore.py)
 DEFAULT_ROW_FORMAT_HEADER = "{:^10}{:^10}{:^18}{:^18}"
 DEFAULT_ROW_FORMAT_DATA = "{:< 10.6f}{:> 10.3f}{:< 18.7e}{:< 18.7e}"
 
@@ -24,6 +27,12 @@ DEFAULT_SD_MAX_CURRENT = 10E-6
 DEFAULT_SD_DELAY = 0
 DEFAULT_V_SD = 4E-3
 DEFAULT_SD_NUM_POINTS = 1
+# how doSweep averages the sdNumPoints readings at each gate voltage, see Keithley2400.setAveraging
+# 'trace' or 'repeat' average on the Keithley, None reads every reading back and averages them here
+DEFAULT_SD_AVERAGING = 'trace'
+# speed profile for both Keithleys, one of 'fast', 'balanced', 'precise' (see Keithley2400.setSpeed)
+# or None to leave their integration time, autozero, display and auto-range settings alone
+DEFAULT_SPEED_PROFILE = None
 
 DEFAULT_GATE_MAX_CURRENT = 1E-6
 DEFAULT_GATE_DELAY = 0
@@ -31,27 +40,49 @@ DEFAULT_V_GATE_SWEEP_START = -10
 DEFAULT_V_GATE_SWEEP_STOP = 10
 DEFAULT_V_GATE_SWEEP_STEP = 0.2
 
-from keithley import Keithley2400
+from keithley import openKeithley, legValues
+from columnStore import ColumnWriter, STORE_EXTENSION
+from runCatalog import openCatalog
+from backgroundWriter import defaultWriter
+from plotRender import decimate, renderLater
+from sweepAnalysis import sweepRate
+import copy
 import time
 import numpy
-import os
-import matplotlib.pyplot as plt
 
+try:
+    input = raw_input  # python 2
+except NameError:
+    pass
 
 # convenience function for updating measurement parameters
 def updateIfNew(oldValue, message):
-    newValue = raw_input(message + ' (' + str(oldValue) + '): ')
-    print ''
+    newValue = input(message + ' (' + str(oldValue) + '): ')
+    print('')
     if newValue == '':
         return oldValue
     else:
         return newValue
 
 
+# gate voltages for a sweep from start to stop and back to start, in steps of step
+def gateProfile(start, stop, step):
+    return numpy.array(legValues([(start, stop, step), (stop, start, step)]))
+
+
+# gate voltages for a pulsed sweep, returning to base between each of the levels
+def pulsedProfile(levels, base=0):
+    return numpy.column_stack((levels, numpy.ones(len(levels)) * base)).ravel()
+
+
 class gateSweep(object):
-    def __init__(self):
+    # transportFactory(GPIBaddr) is used to open each Keithley, e.g. simKeithley.SimulatedBus().open
+    # pass changeParams='n' to use the default parameters without prompting
+    def __init__(self, transportFactory=None, changeParams='y'):
+        self.transportFactory = transportFactory
         self.savePath = DEFAULT_SAVE_PATH
         self.saveFile = DEFAULT_SAVE_FILE
+        self.fileFormat = DEFAULT_FILE_FORMAT
 
         self.gateMaxCurrent = DEFAULT_GATE_MAX_CURRENT
         self.gateDelay = DEFAULT_GATE_DELAY
@@ -65,19 +96,28 @@ class gateSweep(object):
 
         self.sdDelay = DEFAULT_SD_DELAY
         self.sdNumPoints = DEFAULT_SD_NUM_POINTS
+        self.sdAveraging = DEFAULT_SD_AVERAGING
+        self.speedProfile = DEFAULT_SPEED_PROFILE
 
-        self.sdKeithley = Keithley2400(DEFAULT_SD_KEITHLEY_GPIB)
-        self.gateKeithley = Keithley2400(DEFAULT_GATE_KEITHLEY_GPIB)
+        self.sdKeithley = self._openKeithley(DEFAULT_SD_KEITHLEY_GPIB)
+        self.gateKeithley = self._openKeithley(DEFAULT_GATE_KEITHLEY_GPIB)
 
-        self.setup('y')
+        self.setup(changeParams)
+
+    # open the Keithley at GPIBaddr, through self.transportFactory if there is one
+    # a Keithley that is already open is reused as it is, w/o resetting it
+    def _openKeithley(self, GPIBaddr):
+        transport = self.transportFactory(GPIBaddr) if self.transportFactory else None
+        return openKeithley(GPIBaddr, transport=transport)
 
     # set up the gate sweep parameters
     def setup(self, changeParams=None):
-	if not changeParams:
-            changeParams = raw_input('Change parameters [y|N]? ')
+        if not changeParams:
+            changeParams = input('Change parameters [y|N]? ')
         if changeParams == 'y':
             self.savePath = str(updateIfNew(self.savePath, 'Save path'))
             self.saveFile = str(updateIfNew(self.saveFile, 'Save filename'))
+            self.fileFormat = str(updateIfNew(self.fileFormat, 'Save file format ["text" or "columns"]'))
 
             self.gateMaxCurrent = float(updateIfNew(self.gateMaxCurrent, 'Limit for I_gate'))
             self.gateDelay = float(updateIfNew(self.gateDelay, 'Gate sweep delay'))
@@ -91,11 +131,13 @@ class gateSweep(object):
 
             self.sdDelay = float(updateIfNew(self.sdDelay, 'Source-drain delay'))
             self.sdNumPoints = int(updateIfNew(self.sdNumPoints, 'Source-drain points to avg over'))
+            speedProfile = str(updateIfNew(self.speedProfile, 'Speed profile ["fast", "balanced", "precise" or "None"]'))
+            self.speedProfile = None if speedProfile == 'None' else speedProfile
 
             sourceDrainGPIB = int(updateIfNew(DEFAULT_SD_KEITHLEY_GPIB, 'Source-drain Keithley GPIB address'))
             gateGPIB = int(updateIfNew(DEFAULT_GATE_KEITHLEY_GPIB, 'Gate Keithley GPIB address'))
-            self.sdKeithley = Keithley2400(sourceDrainGPIB)
-            self.gateKeithley = Keithley2400(gateGPIB)
+            self.sdKeithley = self._openKeithley(sourceDrainGPIB)
+            self.gateKeithley = self._openKeithley(gateGPIB)
 
             if (self.VgateStop - self.VgateStart) * self.VgateStep < 0:
                 print("Gate sweep step must be positive for sweeps starting low, negative for sweeps starting high")
@@ -104,29 +146,33 @@ class gateSweep(object):
         self._configureMeasurement()
 
     def _configureMeasurement(self):
-	# configure the gate keithley
+        # configure the gate keithley
         self.gateKeithley.setMeasure('current')
-        self.gateKeithley.write("SOURCE:VOLT:RANGE " + str(self.VgateStop))
+        self.gateKeithley.setSourceRange('voltage', self.VgateStop)
         self.gateKeithley.setSourceDC('voltage', 0)
         self.gateKeithley.setCompliance('current', self.gateMaxCurrent)
         self.gateKeithley.setNumPoints(1)
         self.gateKeithley.setDelay(self.gateDelay)
 
-	# configure the source-drain keithley
+        # configure the source-drain keithley
         if self.sdBiasType=='voltage':
             self.sdKeithley.setMeasure('current')
-            self.sdKeithley.write("SOURCE:VOLT:RANGE " + str(self.sdBias))
+            self.sdKeithley.setSourceRange('voltage', self.sdBias)
             self.sdKeithley.setSourceDC('voltage', 0)
             self.sdKeithley.setCompliance('current', self.sdCompliance)
         elif self.sdBiasType=='current':
             self.sdKeithley.setMeasure('voltage')
-            self.sdKeithley.write("SOURCE:CURR:RANGE " + str(self.sdBias))
+            self.sdKeithley.setSourceRange('current', self.sdBias)
             self.sdKeithley.setSourceDC('current', 0)
             self.sdKeithley.setCompliance('voltage', self.sdCompliance)
-	    
+
         self.sdKeithley.setNumPoints(self.sdNumPoints)  # take 10 measurements at each point, average later
         self.sdKeithley.setDelay(self.sdDelay)
 
+        if self.speedProfile:
+            self.gateKeithley.setSpeed(self.speedProfile)
+            self.sdKeithley.setSpeed(self.speedProfile)
+
     # perform a measurement with two keithleys joined over the TLINK interface (see Keithley 2400 manual)
     # can acheive faster sweep speeds than non-TLINK doSweep()
     def doTLINKSweep(self):
@@ -142,123 +188,207 @@ class gateSweep(object):
         self.sdKeithley.setTLINK('SOURCE', 'SENSE')
         self.gateKeithley.setTLINK('SOURCE', 'SENSE')
 
-        # collect data while gate sweeps from VgateStart to VgateStop
-        numPts = self.gateKeithley.setSourceSweep('voltage', self.VgateStart, self.VgateStop, self.VgateStep,
-                                                  self.gateDelay)
-        self.sdKeithley.setNumPoints(numPts)
-
-        self.gateKeithley._startNoWait()
-        self.sdKeithley._startNoWait()
-        self.gateKeithley._catchSRQ()
-        self.sdKeithley._catchSRQ()
-        self.gateKeithley._pullData()
-        self.sdKeithley._pullData()
-
-        # collect data while gate sweeps from VgateStop back to VgateStart
-        numPts = self.gateKeithley.setSourceSweep('voltage', self.VgateStop, self.VgateStart, -self.VgateStep,
-                                                  self.gateDelay)
-        self.sdKeithley.setNumPoints(numPts)
-
-        self.gateKeithley._startNoWait()
-        self.sdKeithley._startNoWait()
-        self.gateKeithley._catchSRQ()
-        self.sdKeithley._catchSRQ()
-        self.gateKeithley._pullData()
-        self.sdKeithley._pullData()
+        for start, stop, step in self._TLINKLegs():
+            numPts = self.gateKeithley.setSourceSweep('voltage', start, stop, step, self.gateDelay)
+            self.sdKeithley.setNumPoints(numPts)
+
+            self.gateKeithley._startNoWait()
+            self.sdKeithley._startNoWait()
+            self.gateKeithley._catchSRQ()
+            self.sdKeithley._catchSRQ()
+            self.gateKeithley._pullData()
+            self.sdKeithley._pullData()
 
         # turn everything off
         self.sdKeithley.rampOutputOff(self.sdBias, DEFAULT_SD_RAMP_STEP)
         self.gateKeithley.rampOutputOff(self.VgateStart, DEFAULT_V_GATE_RAMP_STEP)
         self.sdKeithley._stopMeasurement()
         self.gateKeithley._stopMeasurement()
+        self._finishTLINKSweep()
+
+        # set up the Keithleys to stop using TLINK triggering
+        self.sdKeithley.setNoTLINK()
+        self.gateKeithley.setNoTLINK()
+
+    # perform a measurement with the whole gate waveform uploaded to the gate keithley as a source list,
+    # which triggers the source-drain keithley over TLINK at each point; the data is read back at the end
+    # as fast as doTLINKSweep(), but gateValues can be any sequence of gate voltages (non-linear,
+    # hysteresis loops, pulses, see gateProfile() and pulsedProfile()), by default VgateStart to VgateStop and back
+    def doListSweep(self, gateValues=None):
+        if gateValues is None:
+            gateValues = gateProfile(self.VgateStart, self.VgateStop, self.VgateStep)
+        self.data = [[], [], [], []]  # time, V_gate, I_sd, I_gate
+        self.sdKeithley._clearData()
+        self.gateKeithley._clearData()
+
+        self.gateKeithley.rampOutputOn(gateValues[0], DEFAULT_V_GATE_RAMP_STEP)
+        self.sdKeithley.rampOutputOn(self.sdBias, DEFAULT_SD_RAMP_STEP)
+
+        # set up the Keithleys to use TLINK triggering
+        self.sdKeithley.setTLINK('SOURCE', 'SENSE')
+        self.gateKeithley.setTLINK('SOURCE', 'SENSE')
+
+        # long waveforms are run in pieces, see Keithley2400.doListSweep
+        self.gateKeithley.doListSweep('voltage', gateValues, self.gateDelay, linked=[self.sdKeithley])
+
+        # turn everything off, the gate is left at the end of the waveform
+        self.sdKeithley.rampOutputOff(self.sdBias, DEFAULT_SD_RAMP_STEP)
+        self.gateKeithley.rampOutputOff(gateValues[-1], DEFAULT_V_GATE_RAMP_STEP)
+        self.sdKeithley._stopMeasurement()
+        self.gateKeithley._stopMeasurement()
 
         self.data[0] = self.gateKeithley.dataTime
         self.data[1] = self.gateKeithley.dataVolt
         self.data[2] = self.sdKeithley.dataCurr
         self.data[3] = self.gateKeithley.dataCurr
 
-        print('V_gate sweep rate (V/s): ' + str(self.calcRate()))
-        self.saveData(self.savePath, self.saveFile)
-        self.savePlot(self.savePath, self.saveFile)
-
         # set up the Keithleys to stop using TLINK triggering
         self.sdKeithley.setNoTLINK()
         self.gateKeithley.setNoTLINK()
 
     # perform a measurement with two keithleys joined via the computer
     # the back-and-forth with the computer makes this slower than doTLINKSweep()
-    def doSweep(self):
+    # live=True shows the data in a LiveMonitor window as it is taken
+    def doSweep(self, live=False):
         self.data = [[], [], [], []]  # time, V_gate, I_sd, I_gate
+        monitor = None
+        if live:
+            from liveMonitor import LiveMonitor  # imports pyplot, so only when it is needed
+            monitor = LiveMonitor(['bs', 'ro'], ylabel='Current (A)', xlabel='Gate voltage (V)',
+                                  xlim=[self.VgateStart, self.VgateStop])
 
         self.Vgate = self.gateKeithley.rampOutputOn(self.VgateStart, DEFAULT_V_GATE_RAMP_STEP)
         self.sdKeithley.rampOutputOn(self.sdBias, self.sdBias/20)#DEFAULT_SD_RAMP_STEP)
-
-        startTime = time.time()
-        # ramp up gate voltage while taking data
-        while self.Vgate < self.VgateStop:
-            self.data[0].append(time.time() - startTime)
-
-            self.sdKeithley._startMeasurement()
-            self.sdKeithley._pullData()
-            self.sdKeithley.write("TRACE:CLEAR")
-            self.gateKeithley._startMeasurement()
-            self.gateKeithley._pullData()
-            self.sdKeithley.write("TRACE:CLEAR")
-
-            self.data[1].append(self.Vgate)
-            # average over (self.sdNumPoints) most recent current readings
-            self.data[2].append(numpy.mean(self.sdKeithley.dataCurr[-self.sdNumPoints:]))
-            self.data[3].append(numpy.mean(self.gateKeithley.dataCurr[-1:]))
-
-            self.Vgate += self.VgateStep
-            self.gateKeithley.setSourceDC('voltage', self.Vgate)
-        # ramp down gate voltage while taking data
-        while self.Vgate > self.VgateStart:
-            self.data[0].append(time.time() - startTime)
-
-            self.sdKeithley._startMeasurement()
-            self.sdKeithley._pullData()
-            self.sdKeithley.write("TRACE:CLEAR")
-            self.gateKeithley._startMeasurement()
-            self.gateKeithley._pullData()
-            self.sdKeithley.write("TRACE:CLEAR")
-
-            self.data[1].append(self.Vgate)
-            self.data[2].append(
-                numpy.mean(self.sdKeithley.dataCurr[-self.sdNumPoints:]))  # average 10 most recent current readings
-            self.data[3].append(numpy.mean(self.gateKeithley.dataCurr[-1:]))
-
-            self.Vgate -= self.VgateStep
-            self.gateKeithley.setSourceDC('voltage', self.Vgate)
-
-        self.sdKeithley.rampOutputOff(self.sdBias, self.sdBias/20)#DEFAULT_SD_RAMP_STEP)
-        self.gateKeithley.rampOutputOff(self.Vgate, DEFAULT_V_GATE_RAMP_STEP)
-
-	# self.sdKeithley.saveData(DEFAULT_SAVE_PATH, DEFAULT_SAVE_FILE, 'i')
+        self._startAveraging()
+        try:
+            startTime = time.time()
+            # ramp up gate voltage while taking data
+            while self.Vgate < self.VgateStop:
+                self.data[0].append(time.time() - startTime)
+
+                self.sdKeithley._startMeasurement()
+                self.sdKeithley._pullData()
+                self.sdKeithley.write("TRACE:CLEAR")
+                self.gateKeithley._startMeasurement()
+                self.gateKeithley._pullData()
+                self.sdKeithley.write("TRACE:CLEAR")
+
+                self._recordPoint()
+                if monitor:
+                    self._monitorPoint(monitor)
+
+                self.Vgate += self.VgateStep
+                self.gateKeithley.setSourceDC('voltage', self.Vgate)
+            # ramp down gate voltage while taking data
+            while self.Vgate > self.VgateStart:
+                self.data[0].append(time.time() - startTime)
+
+                self.sdKeithley._startMeasurement()
+                self.sdKeithley._pullData()
+                self.sdKeithley.write("TRACE:CLEAR")
+                self.gateKeithley._startMeasurement()
+                self.gateKeithley._pullData()
+                self.sdKeithley.write("TRACE:CLEAR")
+
+                self._recordPoint()
+                if monitor:
+                    self._monitorPoint(monitor)
+
+                self.Vgate -= self.VgateStep
+                self.gateKeithley.setSourceDC('voltage', self.Vgate)
+
+            if monitor:
+                monitor.refresh()
+        finally:
+            # from wherever the gate got to, also if the sweep failed; the other sweeps need raw readings
+            self.sdKeithley.rampOutputOff(self.sdBias, self.sdBias/20)#DEFAULT_SD_RAMP_STEP)
+            self.gateKeithley.rampOutputOff(self.Vgate, DEFAULT_V_GATE_RAMP_STEP)
+            self._stopAveraging()
+
+        # self.sdKeithley.saveData(DEFAULT_SAVE_PATH, DEFAULT_SAVE_FILE, 'i')
         # print('V_gate sweep rate (V/s): ' + str(self.calcRate()))
         # self.saveData(self.savePath, self.saveFile)
         # self.savePlot(self.savePath, self.saveFile)
 
+    # have the source-drain Keithley average the sdNumPoints readings at each gate voltage for doSweep,
+    # so only the average is read back
+    def _startAveraging(self):
+        if self.sdAveraging and self.sdNumPoints > 1:
+            self.sdKeithley.setAveraging(self.sdAveraging, self.sdNumPoints)
+            if self.sdAveraging != 'trace':
+                self.sdKeithley.setNumPoints(1)  # the filter averages each reading
+
+    # back to raw readings for the TLINK and list sweeps
+    def _stopAveraging(self):
+        if self.sdKeithley.averaging:
+            self.sdKeithley.setAveraging(None)
+            self.sdKeithley.setNumPoints(self.sdNumPoints)
+
+    # add the point just measured at self.Vgate to self.data (the time is added before it is measured)
+    def _recordPoint(self):
+        self.data[1].append(self.Vgate)
+        self.data[2].append(self._sdCurrent())
+        self.data[3].append(numpy.mean(self.gateKeithley.dataCurr[-1:]))
+
+    # the (start, stop, step) gate sweeps of doTLINKSweep: from VgateStart to VgateStop, then back to VgateStart
+    def _TLINKLegs(self):
+        return ((self.VgateStart, self.VgateStop, self.VgateStep),
+                (self.VgateStop, self.VgateStart, -self.VgateStep))
+
+    # collect the data of a TLINK sweep from the two Keithleys, report how fast it went and save it
+    def _finishTLINKSweep(self):
+        self.data[0] = self.gateKeithley.dataTime
+        self.data[1] = self.gateKeithley.dataVolt
+        self.data[2] = self.sdKeithley.dataCurr
+        self.data[3] = self.gateKeithley.dataCurr
+
+        print('V_gate sweep rate (V/s): ' + str(self.calcRate()))
+        self.printReadingRate()
+        self.saveInBackground(self.savePath, self.saveFile)
+
+    # the source-drain current at the latest gate voltage, averaged over its sdNumPoints readings
+    def _sdCurrent(self):
+        if self.sdKeithley.averaging:
+            return self.sdKeithley.dataCurr[-1]
+        return numpy.mean(self.sdKeithley.dataCurr[-self.sdNumPoints:])
+
+    # add the latest point of self.data to the live plot
+    def _monitorPoint(self, monitor):
+        monitor.append(0, self.data[1][-1:], self.data[2][-1:])
+        monitor.append(1, self.data[1][-1:], self.data[3][-1:])
+
+    # readings per second the source-drain Keithley achieved in the last sweep, and what its speed settings promised
+    def printReadingRate(self):
+        achieved = self.sdKeithley.achievedRate()
+        if achieved is None:
+            return
+        expected = self.sdKeithley.speedStats.get('expectedRate')
+        print('Readings per second: ' + "{:.1f}".format(achieved) +
+              ('' if expected is None else ' (expected ' + "{:.1f}".format(expected) + ')'))
+
+    # V_gate sweep rate (V/s) fitted over the ramp up, see sweepAnalysis.sweepRate
     def calcRate(self):
-        dataLen = len(self.data[0])
-        return numpy.polyfit(self.data[0][0:dataLen / 2], self.data[1][0:dataLen / 2], 1)[0]
+        return sweepRate(self.data[0], self.data[1])[0]
 
     # save the collected Data
     # filePath must have trailing slash, fileName must have .txt extension
     # mode 'a' appends to existing file, mode 'i' increments file counter ie test0001.txt, test0002,txt
 
-    def saveData(self, filePath=DEFAULT_SAVE_PATH, fileName=DEFAULT_SAVE_FILE, mode='i'):
+    # fileFormat 'columns' appends self.data to a binary column store, by default self.fileFormat is used
+    def saveData(self, filePath=DEFAULT_SAVE_PATH, fileName=DEFAULT_SAVE_FILE, mode='i', fileFormat=None):
+        if fileFormat is None:
+            fileFormat = self.fileFormat
+        if fileFormat == 'columns':
+            return self._saveColumns(filePath, fileName, mode)
+        elif fileFormat != 'text':
+            print("invalid file format")
+            return -1
+
         if mode == 'a':
             saveFile = open(filePath + fileName, "a+")
         elif mode == "i":
-            self.saveCounter = 0
-            while True:
-                self.saveCounter += 1
-                print("checking file: " + filePath + fileName[:-4] + "{:04d}".format(self.saveCounter) + ".txt")
-                if not os.path.exists(filePath + fileName[:-4] + "{:04d}".format(self.saveCounter) + ".txt"):
-                    break
-            print("")
-            saveFile = open(filePath + fileName[:-4] + "{:04d}".format(self.saveCounter) + ".txt", "a+")
+            savePath, self.saveCounter = openCatalog(filePath).nextPath(fileName[:-4], ".txt")
+            saveFile = open(savePath, "a+")
         else:
             print("invalid mode")
             return -1
@@ -277,65 +407,103 @@ class gateSweep(object):
                 DEFAULT_ROW_FORMAT_DATA.format(self.data[0][i], self.data[1][i], self.data[2][i], self.data[3][i]))
             saveFile.write("\n")
         saveFile.close()
+        if mode == "i":
+            self._catalogRun(filePath, saveFile.name)
+        return saveFile.name
+
+    # append self.data to a column store as one sweep, along with the sweep parameters
+    def _saveColumns(self, filePath, fileName, mode='i'):
+        if mode == 'a':
+            storePath = filePath + fileName[:-4] + STORE_EXTENSION
+        elif mode == "i":
+            storePath, self.saveCounter = openCatalog(filePath).nextPath(fileName[:-4], STORE_EXTENSION)
+        else:
+            print("invalid mode")
+            return -1
 
+        store = ColumnWriter(storePath, ['t', 'V_gate', 'I_sd', 'I_gate'], ['seconds', 'volts', 'amps', 'amps'])
+        store.append(self.data, settings=self.sweepParams())
+        if mode == "i":
+            self._catalogRun(filePath, storePath)
+        return storePath
+
+    # the parameters of the sweep, as saved alongside the data
+    def sweepParams(self):
+        return {'VgateStart': self.VgateStart, 'VgateStop': self.VgateStop, 'VgateStep': self.VgateStep,
+                'gateDelay': self.gateDelay, 'sdBiasType': self.sdBiasType, 'sdBias': self.sdBias,
+                'sdCompliance': self.sdCompliance, 'sdNumPoints': self.sdNumPoints}
+
+    # record a saved run in the data directory's run catalog (see runCatalog.py)
+    def _catalogRun(self, filePath, savePath):
+        params = self.sweepParams()
+        params['numPoints'] = len(self.data[0])
+        timings = {'duration': float(self.data[0][-1] - self.data[0][0]) if len(self.data[0]) else 0}
+        instruments = {'sd': self.sdKeithley.GPIBaddr, 'gate': self.gateKeithley.GPIBaddr}
+        return openCatalog(filePath).record(savePath, params, instruments, timings)
+
+    # save the data and the plot on the background writer thread (see backgroundWriter.py), so the next
+    # sweep can start straight away; returns the jobs for the data file and the plot, job.result() waits for them
+    def saveInBackground(self, filePath=DEFAULT_SAVE_PATH, fileName=DEFAULT_SAVE_FILE, mode='i'):
+        # the jobs get a copy of this sweep's data, the next sweep replaces self.data
+        snapshot = copy.copy(self)
+        snapshot.data = [numpy.array(column) for column in self.data]
+        writer = defaultWriter()
+        return (writer.submit(snapshot.saveData, filePath, fileName, mode),
+                writer.submit(snapshot.savePlot, filePath, fileName, mode))
+
+    # rendered in a separate process with the points decimated (see plotRender.py), so neither this process
+    # nor the background writer thread spends long drawing large sweeps
     def savePlot(self, filePath=DEFAULT_SAVE_PATH, fileName=DEFAULT_SAVE_FILE, mode='i'):
         if mode == 'a':
             saveFileName = filePath + fileName[:-4] + '.png'
         elif mode == "i":
-            self.saveCounter = 0
-            while True:
-                self.saveCounter += 1
-                print("checking file: " + filePath + fileName[:-4] + "{:04d}".format(self.saveCounter) + ".png")
-                if not os.path.exists(filePath + fileName[:-4] + "{:04d}".format(self.saveCounter) + ".png"):
-                    break
-            print("")
-            saveFileName = filePath + fileName[:-4] + "{:04d}".format(self.saveCounter) + ".png"
+            saveFileName, self.saveCounter = openCatalog(filePath).nextPath(fileName[:-4], ".png")
         else:
             print("invalid mode")
             return -1
 
-        plt.plot(self.data[1], self.data[2], 'bs')
-        plt.plot(self.data[1], self.data[3], 'ro')
-        plt.title("{:< 5.3f}".format(self.calcRate()) + " V/s")
-        plt.ylabel('Current (A)')
-        plt.xlabel('Gate voltage (V)')
-	plt.xlim([self.VgateStart, self.VgateStop])
-        plt.savefig(saveFileName, bbox_inches='tight')
-        plt.close()
+        return renderLater(saveFileName, [(self.data[1], self.data[2], 'bs'), (self.data[1], self.data[3], 'ro')],
+                           title="{:< 5.3f}".format(self.calcRate()) + " V/s",
+                           ylabel='Current (A)', xlabel='Gate voltage (V)',
+                           xlim=[self.VgateStart, self.VgateStop]).get()
 
+    # large sweeps are decimated to the min and max of each bin first (see plotRender.py)
     def plotData(self):
-        plt.plot(self.data[1], self.data[2], 'bs')
-        plt.plot(self.data[1], self.data[3], 'ro')
+        import matplotlib.pyplot as plt  # slow to import, so only when it is needed
+        Vgate, Isd = decimate(self.data[1], self.data[2])
+        plt.plot(Vgate, Isd, 'bs')
+        Vgate, Igate = decimate(self.data[1], self.data[3])
+        plt.plot(Vgate, Igate, 'ro')
         plt.title("{:< 5.3f}".format(self.calcRate()) + " V/s")
         plt.ylabel('Current (A)')
         plt.xlabel('Gate voltage (V)')
-	plt.xlim([self.VgateStart, self.VgateStop])
+        plt.xlim([self.VgateStart, self.VgateStop])
         plt.show()
         plt.close()
 
 
 if __name__=="__main__":
 
-	gs = gateSweep()
-	option_dict = {
-			1: ['configure sweep', gs.setup], 
-			2: ['do sweep', gs.doSweep], 
-			3: ['plot data', gs.plotData], 
-			4: ['save data', gs.saveData], 
-			5: ['quit']
-			}
-
-	while True:
-		print '********************'
-		for key in option_dict:
-			print key, option_dict[key][0]
-		print ''
-
-		try:
-		    cmd = input('Enter an option [1-5]: ')
-		    option_dict[cmd][1]()
-	        except IndexError:
-		    break
-       	        except Exception as e:
-		    print e
-		    pass
+        gs = gateSweep()
+        option_dict = {
+                        1: ['configure sweep', gs.setup],
+                        2: ['do sweep', gs.doSweep],
+                        3: ['plot data', gs.plotData],
+                        4: ['save data', gs.saveData],
+                        5: ['quit']
+                        }
+
+        while True:
+                print('********************')
+                for key in option_dict:
+                        print(key, option_dict[key][0])
+                print('')
+
+                try:
+                    cmd = int(input('Enter an option [1-5]: '))
+                    option_dict[cmd][1]()
+                except IndexError:
+                    break
+                except Exception as e:
+                    print(e)
+                    pass
@@ -0,0 +1,52 @@
+# checks that importing the measurement modules stays fast, i.e.
+# $ python importBenchmark.py
+# each module is imported in a fresh interpreter, best of NUM_RUNS; exits with status 1 if any module goes
+# over its budget or pulls in one of the slow optional dependencies (pandas, matplotlib) at import time,
+# those are only imported when saveToFile, plotData, savePlot or a LiveMonitor needs them
+
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+
+NUM_RUNS = 5
+# seconds, numpy alone takes about 0.1 s
+IMPORT_BUDGETS = {'keithley': 0.3, 'gateSweep': 0.4, 'ivSweep': 0.4}
+LAZY_MODULES = ('pandas', 'matplotlib')
+ROW_FORMAT = "{:<12}{:>8.3f} s  (budget {:.3f} s)  {}"
+
+# prints the import time and any lazy modules that got imported anyway
+PROBE = """
+import sys, time
+startTime = time.time()
+import {module}
+print(time.time() - startTime)
+print(' '.join(name for name in {lazy!r} if name in sys.modules))
+"""
+
+
+def importTime(module):
+    here = os.path.dirname(os.path.abspath(__file__))
+    best, loaded = None, ''
+    for i in range(NUM_RUNS):
+        output = subprocess.check_output([sys.executable, '-c', PROBE.format(module=module, lazy=LAZY_MODULES)],
+                                         cwd=here).decode().split('\n')
+        seconds = float(output[0])
+        best = seconds if best is None else min(best, seconds)
+        loaded = output[1].strip()
+    return best, loaded
+
+
+if __name__ == "__main__":
+    failed = False
+    for module in sorted(IMPORT_BUDGETS):
+        seconds, loaded = importTime(module)
+        problem = ''
+        if seconds > IMPORT_BUDGETS[module]:
+            problem = 'OVER BUDGET'
+        if loaded:
+            problem += ' imports ' + loaded
+        print(ROW_FORMAT.format(module, seconds, IMPORT_BUDGETS[module], problem))
+        failed = failed or bool(problem)
+    sys.exit(1 if failed else 0)
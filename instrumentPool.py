@@ -0,0 +1,134 @@
+# run the same measurement on many Keithleys at once, e.g. one sourcemeter per device channel, i.e.
+# >>> pool = InstrumentPool([23, 24, (1, 5), (1, 6)])  # (board, address) for Keithleys on a second GPIB card
+# >>> pool.run(lambda k: k.setMeasure('current'))
+# >>> results = pool.sweep('voltage', -5E-3, 5E-3, 1E-4)
+# >>> results.errors  # {(1, 6): 'VisaIOError: ...'}, the other sweeps still finish
+# >>> results.stack()  # readings from the instruments that succeeded, one (numPts, 5) block per instrument
+#
+# each instrument is driven from a thread of its own. The Keithleys on a board share one bus lock, so
+# transactions on a board never overlap, and they poll their status bytes rather than wait for SRQ,
+# so the bus stays free while the sweeps run
+
+from __future__ import print_function
+
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+import numpy
+
+from keithley import openKeithley, getKeithley, closeKeithley, DEFAULT_TIME_STEP
+
+
+# a sweep on one Keithley, returns a copy of its readings, one (V, I, I/V, time, ?) row per reading
+def measureSweep(keithley, source, startValue, stopValue, sourceStep, timeStep=DEFAULT_TIME_STEP, timeout=None):
+    keithley.setSourceSweep(source, startValue, stopValue, sourceStep, timeStep)
+    keithley._clearData()
+    keithley._startNoWait()
+    keithley._catchSRQ(timeout)
+    keithley._pullData()
+    keithley._stopMeasurement()
+    return keithley.buffer.rows().copy()
+
+
+class PoolResult(object):
+    """What each instrument in a pool returned, or the error it raised, and how long it took"""
+
+    def __init__(self):
+        self.results = OrderedDict()  # key: return value, for the instruments that succeeded
+        self.errors = OrderedDict()  # key: error message, for the instruments that failed
+        self.timings = OrderedDict()  # key: (start time, seconds taken)
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    # the results of the instruments that succeeded stacked into one array, first axis in pool order
+    # returns (keys, array); results of different lengths are padded w/ NaN
+    def stack(self):
+        keys = list(self.results)
+        arrays = [numpy.asarray(self.results[key], dtype=float) for key in keys]
+        if not arrays:
+            return keys, numpy.empty(0)
+        length = max(len(array) for array in arrays)
+        stacked = numpy.full((len(arrays), length) + arrays[0].shape[1:], numpy.nan)
+        for i, array in enumerate(arrays):
+            stacked[i, :len(array)] = array
+        return keys, stacked
+
+
+class InstrumentPool(object):
+    """A set of Keithley2400s driven in parallel, one thread per instrument"""
+
+    # addresses are GPIB addresses on board 0 or (board, address) pairs
+    # transportFactory(GPIBaddr, board) opens each transport, e.g. simKeithley.SimulatedBus().open
+    # the Keithleys come from openKeithley, so a Keithley that is already open is shared w/ the rest of the process
+    # close() gives those back as they were and only closes the ones the pool opened
+    def __init__(self, addresses, transportFactory=None):
+        self.boardLocks = {}
+        self.keithleys = OrderedDict()
+        self.owned = set()  # addresses of the Keithleys the pool opened
+        self.previous = {}  # address: (busLock, srqPolling) the Keithley had before it joined the pool
+        for address in addresses:
+            board, GPIBaddr = address if isinstance(address, tuple) else (0, address)
+            transport = transportFactory(GPIBaddr, board) if transportFactory else None
+            alreadyOpen = getKeithley(GPIBaddr, board)
+            keithley = openKeithley(GPIBaddr, board=board, transport=transport)
+            if keithley is not alreadyOpen:
+                self.owned.add(address)
+            self.previous[address] = (keithley.busLock, keithley.srqPolling)
+            keithley.busLock = self.boardLocks.setdefault(board, threading.RLock())
+            keithley.srqPolling = True
+            self.keithleys[address] = keithley
+
+    def __len__(self):
+        return len(self.keithleys)
+
+    def __getitem__(self, address):
+        return self.keithleys[address]
+
+    # call function(keithley, *args, **kwargs) for every instrument at once and wait for them all
+    # an error on one instrument is recorded in the result and doesn't stop the others
+    def run(self, function, *args, **kwargs):
+        result = PoolResult()
+        lock = threading.Lock()
+
+        def work(key, keithley):
+            startTime = time.time()
+            try:
+                value = function(keithley, *args, **kwargs)
+                with lock:
+                    result.results[key] = value
+            except Exception as e:
+                with lock:
+                    result.errors[key] = type(e).__name__ + ': ' + str(e)
+                print("instrument " + str(key) + " failed:")
+                traceback.print_exc()
+            finally:
+                with lock:
+                    result.timings[key] = (startTime, time.time() - startTime)
+
+        threads = [threading.Thread(target=work, args=item) for item in self.keithleys.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # keep pool order rather than finishing order
+        for table in (result.results, result.errors, result.timings):
+            ordered = [(key, table[key]) for key in self.keithleys if key in table]
+            table.clear()
+            table.update(ordered)
+        return result
+
+    # the same sweep on every instrument at once, see measureSweep
+    def sweep(self, source, startValue, stopValue, sourceStep, timeStep=DEFAULT_TIME_STEP, timeout=None):
+        return self.run(measureSweep, source, startValue, stopValue, sourceStep, timeStep, timeout)
+
+    # close the Keithleys the pool opened, and put back the bus lock and SRQ setting of those it shared
+    def close(self):
+        for address, keithley in self.keithleys.items():
+            keithley.busLock, keithley.srqPolling = self.previous[address]
+            if address in self.owned:
+                closeKeithley(keithley)
@@ -1,11 +1,13 @@
 # example script/class using the Keithley2400 python class to do a simple IV curve measurement
 
+from __future__ import print_function
+
 
 DEFAULT_SAVE_PATH = 'C:/Data/'
 DEFAULT_SAVE_FILE = 'ivSweep_.txt'
 
 # use whatever your keithley's GBIP address is
-DEFAULT_GPIB_ADDR = 23  
+DEFAULT_GPIB_ADDR = 23
 
 # set sweep parameters (in volts)
 DEFAULT_MIN_BIAS = -5E-3
@@ -14,99 +16,119 @@ DEFAULT_STEP_BIAS = 1E-4
 DEFAULT_STEP_TIME = 0.1
 
 
-from keithley import Keithley2400
-import matplotlib.pyplot as plt
+from keithley import openKeithley, legValues
+from plotRender import decimate
 import traceback
 
+try:
+    input = raw_input  # python 2
+except NameError:
+    pass
+
 
 # convenience function for updating measurement parameters
 def updateIfNew(oldValue, message):
     '''prompts the user with [message], then returns whatever
     is entered, or [oldValue] if nothing was entered'''
-    newValue = raw_input(message + ' (' + str(oldValue) + '): ')
+    newValue = input(message + ' (' + str(oldValue) + '): ')
     if newValue == '':
-	return oldValue
+        return oldValue
     else:
-	return newValue
+        return newValue
 
 
 class ivSweep(object):
-    def __init__(self):
+    # transportFactory(GPIBaddr) is used to open the Keithley, e.g. simKeithley.SimulatedBus().open
+    # pass changeParams='n' to use the default parameters without prompting
+    def __init__(self, transportFactory=None, changeParams='y'):
+        self.transportFactory = transportFactory
         self.savePath = DEFAULT_SAVE_PATH
         self.saveFile = DEFAULT_SAVE_FILE
 
-	self.minBias = DEFAULT_MIN_BIAS
-	self.maxBias = DEFAULT_MAX_BIAS
-	self.stepBias = DEFAULT_STEP_BIAS
-	self.stepTime = DEFAULT_STEP_TIME
+        self.minBias = DEFAULT_MIN_BIAS
+        self.maxBias = DEFAULT_MAX_BIAS
+        self.stepBias = DEFAULT_STEP_BIAS
+        self.stepTime = DEFAULT_STEP_TIME
 
-	self.k = Keithley2400(DEFAULT_GPIB_ADDR)
+        transport = transportFactory(DEFAULT_GPIB_ADDR) if transportFactory else None
+        self.k = openKeithley(DEFAULT_GPIB_ADDR, transport=transport)
 
-	self.setup('y')
+        self.setup(changeParams)
 
     def setup(self, changeParams=None):
-	if not changeParams:
-            changeParams = raw_input('Change parameters [y|N]? ')
-	if changeParams =='y':
+        if not changeParams:
+            changeParams = input('Change parameters [y|N]? ')
+        if changeParams =='y':
             self.savePath = str(updateIfNew(self.savePath, 'Save path '))
             self.saveFile = str(updateIfNew(self.saveFile, 'Save filename '))
-	    self.minBias = float(updateIfNew(self.minBias, 'Minimum bias '))
-	    self.maxBias = float(updateIfNew(self.maxBias, 'Maximum bias '))
-	    self.stepBias = float(updateIfNew(self.stepBias, 'Bias step '))
-	    self.stepTime = float(updateIfNew(self.stepTime, 'Time step '))
+            self.minBias = float(updateIfNew(self.minBias, 'Minimum bias '))
+            self.maxBias = float(updateIfNew(self.maxBias, 'Maximum bias '))
+            self.stepBias = float(updateIfNew(self.stepBias, 'Bias step '))
+            self.stepTime = float(updateIfNew(self.stepTime, 'Time step '))
         self._configureMeasurement()
 
     def _configureMeasurement(self):
-	self.k.setMeasure('current')
+        self.k.setMeasure('current')
         #self.k.setSourceSweep('voltage', self.minBias, self.maxBias, self.stepBias, self.stepTime)
 
-    def doSweep(self):
+    # sweep from minV to maxV and back to minV in one go, as (start, stop, step) legs
+    def legs(self):
+        return [(self.minBias, self.maxBias, self.stepBias), (self.maxBias, self.minBias, self.stepBias)]
+
+    # live=True streams the sweep in chunks and shows it in a LiveMonitor window as it is taken
+    def doSweep(self, live=False):
         self.k.rampOutputOn(self.minBias, self.stepBias)
-        self.k.setSourceSweep('voltage', self.minBias, self.maxBias, self.stepBias, self.stepTime)  # sweep from minV to maxV
-        self.k._startMeasurement()
-        self.k._pullData()
-        self.k.setSourceSweep('voltage', self.maxBias, self.minBias, -self.stepBias, self.stepTime)  # sweep from maxV to minV
-        self.k._startMeasurement()
-        self.k._pullData()
+        legs = self.legs()
+        if live:
+            from liveMonitor import LiveMonitor  # imports pyplot, so only when it is needed
+            monitor = LiveMonitor(['b-'], xlabel='Bias (V)', ylabel='Measured current (A)',
+                                  xlim=[self.minBias, self.maxBias])
+            for rows in self.k.iterSweep(source='voltage', values=legValues(legs), timeStep=self.stepTime):
+                monitor.append(0, rows[:, 0], rows[:, 1])
+            monitor.refresh()
+        else:
+            self.k.doLegSweep('voltage', legs, self.stepTime)
         self.k.rampOutputOff(self.minBias, self.stepBias)
         self.k._stopMeasurement()
 
+    # large sweeps are decimated to the min and max of each bin first (see plotRender.py)
     def plotData(self):
-        plt.plot(self.k.dataVolt, self.k.dataCurr)
-	plt.xlabel('Bias (V)')
-	plt.ylabel('Measured current (A)')
-	plt.xlim([self.minBias, self.maxBias])
-	plt.show()
-	plt.close()
+        import matplotlib.pyplot as plt  # slow to import, so only when it is needed
+        plt.plot(*decimate(self.k.dataVolt, self.k.dataCurr))
+        plt.xlabel('Bias (V)')
+        plt.ylabel('Measured current (A)')
+        plt.xlim([self.minBias, self.maxBias])
+        plt.show()
+        plt.close()
 
     def saveData(self):
         fname = self.k.saveData(self.savePath, self.saveFile)
-	print('saved to ' + fname)
+        print('saved to ' + fname)
 
 
 if __name__=="__main__":
 
-	iv = ivSweep()
-	option_dict = {
-			1: ['configure sweep', iv.setup], 
-			2: ['do sweep', iv.doSweep], 
-			3: ['plot data', iv.plotData], 
-			4: ['save data', iv.saveData], 
-			5: ['quit']
-			}
-
-	while True:
-		print '********************'
-		for key in option_dict:
-			print key, option_dict[key][0]
-		print ''
-
-		try:
-		    cmd = input('Enter an option [1-5]: ')
-		    option_dict[cmd][1]()
-	        except IndexError:
-		    break
-       	        except Exception as e:
-		    print e
-		    print traceback.format_exc()
-		    pass
+        iv = ivSweep()
+        option_dict = {
+                        1: ['configure sweep', iv.setup],
+                        2: ['do sweep', iv.doSweep],
+                        3: ['plot data', iv.plotData],
+                        4: ['save data', iv.saveData],
+                        5: ['quit']
+                        }
+
+        while True:
+                print('********************')
+                for key in option_dict:
+                        print(key, option_dict[key][0])
+                print('')
+
+                try:
+                    cmd = int(input('Enter an option [1-5]: '))
+                    option_dict[cmd][1]()
+                except IndexError:
+                    break
+                except Exception as e:
+                    print(e)
+                    print(traceback.format_exc())
+                    pass
@@ -3,26 +3,104 @@
 
 # requires a National Instruments VISA driver, can be found at https://www.ni.com/visa/
 
-from visa import GpibInstrument
-from pyvisa.visa_exceptions import VisaIOError
-from math import sqrt, ceil
-import os.path
+try:
+    from visa import GpibInstrument
+    from pyvisa.visa_exceptions import VisaIOError
+except ImportError:
+    # pyvisa is only needed to talk to real hardware, see simKeithley.py to run without it
+    GpibInstrument = None
+
+    class VisaIOError(Exception):
+        pass
+
+VI_ERROR_TMO = -1073807339  # VISA's timeout error code
+from math import sqrt, ceil, floor
+from contextlib import contextmanager
+import atexit
+import threading
 import time
-import pandas as pd
+import numpy
+from dataBuffer import DataBuffer, COLUMNS, UNITS
+from columnStore import ColumnWriter, STORE_EXTENSION
+from runCatalog import openCatalog
 
 DEFAULT_TIME_STEP = 0  # in seconds
 DEFAULT_NUM_POINTS = 1  # number of data points to collect for each measurement
 DEFAULT_ROW_FORMAT_HEADER = "{:^14}{:^14}{:^15}{:^10}{:^8}"
 DEFAULT_ROW_FORMAT_DATA = "{:< 14.6e}{:< 14.6e}{:< 15}{:<10.7}{:<8}"
 DEFAULT_SAVE_PATH = "C://Data/pythonData/",
+DEFAULT_FILE_FORMAT = 'text'  # 'text' for Origin-style text, 'columns' for a binary column store (see columnStore.py)
+DEFAULT_DATA_FORMAT = 'ascii'  # one of 'ascii', 'real32', 'real64'
+DEFAULT_BYTE_ORDER = 'swapped'  # 'swapped' is little-endian, 'normal' is big-endian
+
+# SCPI name and numpy type code for each way of transferring the Keithley's buffer
+DATA_FORMATS = {'ascii': ('ASCII', None), 'real32': ('REAL,32', 'f4'), 'real64': ('REAL,64', 'f8')}
+BYTE_ORDERS = {'normal': ('NORMAL', '>'), 'swapped': ('SWAPPED', '<')}
+MAX_BUFFER_POINTS = 2500  # readings the 2400's buffer (and source list) can hold
+MAX_LIST_CHUNK = 100  # source list values sent per SOURCE:LIST command
+DEFAULT_CHUNK_SIZE = 100  # points per chunk when streaming a sweep with iterSweep
+DEFAULT_POLL_INTERVAL = 50E-3  # seconds between checks of the buffer fill count
+DEFAULT_RAMP_TIME_STEP = 50E-3  # seconds between the steps of a ramp
+DEFAULT_MAX_BATCH_LENGTH = 250  # max characters in one coalesced write, well inside the 2400's input buffer
+DEFAULT_AVERAGE_COUNT = 10  # readings per averaged reading, see setAveraging
+MAX_FILTER_COUNT = 100  # readings the 2400's averaging filter can average over
+AVERAGING_FILTERS = {'repeat': 'REPEAT', 'moving': 'MOVING'}  # filter types, 'trace' uses the buffer statistics
+
+# settings that decide how fast the 2400 takes readings, see setSpeed
+# nplc is the integration time in power line cycles, autoZero 'ONCE' zeroes now and then leaves it off,
+# autoRange 'OFF' holds the present measurement range, sourceDelay is in seconds or 'AUTO'
+SPEED_PROFILES = {
+    'fast': {'nplc': 0.01, 'autoZero': 'OFF', 'display': 'OFF', 'autoRange': 'OFF', 'sourceDelay': 0},
+    'balanced': {'nplc': 0.1, 'autoZero': 'ONCE', 'display': 'OFF', 'autoRange': 'ON', 'sourceDelay': 0},
+    'precise': {'nplc': 10, 'autoZero': 'ON', 'display': 'ON', 'autoRange': 'ON', 'sourceDelay': 'AUTO'},
+}
+MIN_NPLC = 0.01
+MAX_NPLC = 10
+DEFAULT_LINE_FREQUENCY = 60  # Hz
+# rough timings for estimating the reading rate, from the 2400's speed specifications
+READING_OVERHEAD = 0.5E-3  # seconds per reading spent on other than integrating
+DISPLAY_OVERHEAD = 1E-3  # seconds per reading to update the front panel
+AUTO_SOURCE_DELAY = 1E-3  # seconds, the auto source delay on the lower ranges
+AUTO_ZERO_CONVERSIONS = 3  # w/ autozero on every reading also measures the zero and the reference
+
+
+# number of points in a sweep from startValue to stopValue in steps of sourceStep
+def sweepPoints(startValue, stopValue, sourceStep):
+    # allow for rounding error, e.g. (0.3 - 0) / 0.1 is slightly more than 3
+    return int(ceil(abs((stopValue - startValue) / sourceStep) - 1E-9)) + 1
+
+# monotonic clock for pacing ramps and timing transactions, time.monotonic isn't there in python 2
+# the one for the whole package, scpiTracer and monitorLog import it from here
+_clock = getattr(time, 'monotonic', time.time)
 
 
+# levels visited when ramping from rampStart towards rampTarget in steps of step, not including rampStart
+# stops at the level within half a step of rampTarget, like the old step-until-it-gets-no-closer loop
+def rampValues(rampStart, rampTarget, step):
+    if step == 0:
+        return []
+    step = abs(step) if rampTarget >= rampStart else -abs(step)
+    numSteps = int(floor(abs((rampTarget - rampStart) / step) + 0.5 + 1E-9))
+    return [rampStart + i * step for i in range(1, numSteps + 1)]
+
+
+# source values for a sweep made of legs run back to back, each leg a (start, stop, step) tuple
+# e.g. [(-1, 1, 0.1), (1, -1, 0.1)] for a hysteresis loop
+def legValues(legs):
+    values = []
+    for startValue, stopValue, sourceStep in legs:
+        step = abs(sourceStep) if stopValue >= startValue else -abs(sourceStep)
+        numPts = sweepPoints(startValue, stopValue, step)
+        values += [startValue + i * step for i in range(numPts - 1)] + [stopValue]
+    return values
+
 # useful to break up dataAll
 def chunks(l, n):
     return [l[i:i + n] for i in range(0, len(l), n)]
 
 # utility for juypter notebook analysis, TODO: move to masonLab.utils
 def saveToFile(data, columns, fileName='test.txt', filePath='./'  ):
+    import pandas as pd  # slow to import, so only when it is needed
     assert len(data) == len(columns), 'Must have same number of column names and data lists'
 
     if len(data)>1:
@@ -30,59 +108,135 @@ def saveToFile(data, columns, fileName='test.txt', filePath='./'  ):
     else:
         df = pd.DataFrame(data)
     df.columns = columns
-    
-    saveCounter = 0
-    while True:
-        saveCounter += 1
-        if not os.path.exists(filePath + fileName[:-4] + "{:04d}".format(saveCounter) + ".txt"):
-            break
-    saveFile = filePath + fileName[:-4] + "{:04d}".format(saveCounter) + ".txt"
+
+    catalog = openCatalog(filePath)
+    saveFile, saveCounter = catalog.nextPath(fileName[:-4], ".txt")
 
     df.to_csv(saveFile, index=False)
+    catalog.record(saveFile, params={'columns': ','.join(columns), 'numPoints': len(df)})
 
 
 
-class Keithley2400(GpibInstrument):
+class Keithley2400(object):
     """A class to interface with the Keithley 2400 sourcemeter"""
 
-    def __init__(self, GPIBaddr):
+    # transport is anything with the visa.GpibInstrument methods used below (write, read, read_raw,
+    # read_values, trigger, wait_for_srq), by default a visa.GpibInstrument at GPIBaddr
+    # e.g. pass transport=simKeithley.SimulatedKeithley2400() to run without hardware
+    # board picks the GPIB card when there is more than one, i.e. board=1 opens GPIB1::GPIBaddr
+    # reset=False skips the *RST, keeping the Keithley's current setup (see _initialize)
+    # use openKeithley() to get the already open Keithley at an address rather than a new one
+    def __init__(self, GPIBaddr, dataFormat=DEFAULT_DATA_FORMAT, byteOrder=DEFAULT_BYTE_ORDER, transport=None,
+                 board=0, reset=True):
+        self.GPIBaddr = GPIBaddr
+        self.board = board
+        # held for each bus transaction, shared by every Keithley on a board when used from several threads
+        self.busLock = threading.RLock()
+        # poll the status byte rather than wait for SRQ, which can't tell the Keithleys on a board apart
+        self.srqPolling = False
+        self.dataFormat = dataFormat
+        self.byteOrder = byteOrder
+        self.buffer = DataBuffer()
+        self.deviations = DataBuffer()  # standard deviations of the averaged readings, see setAveraging
+        self.averaging = None
+        self.averageDeviation = False
+        self.state = {}
+        self.sweep = None
+        self.maxBatchLength = DEFAULT_MAX_BATCH_LENGTH
+        self.rampStats = {}  # steps, seconds, achieved and target rate of the last ramp
+        self.lineFrequency = DEFAULT_LINE_FREQUENCY
+        self.speedStats = {}  # speed settings, target, expected and achieved readings per second, see setSpeed
+        self._batchDepth = 0
+        self._batchQueue = []
+        self.initialized = False  # set once the Keithley has been set up, see openKeithley
         try:
-            # call the visa.GpibInstrument init method w/ appropriate argument
-            super(Keithley2400, self).__init__("GPIB::%d" % GPIBaddr)
-            self._initialize()
+            # open a visa.GpibInstrument w/ appropriate argument
+            if transport is None:
+                if GpibInstrument is None:
+                    raise ImportError('pyvisa 1.3 is needed to talk to a real Keithley, see simKeithley.py to run without it')
+                transport = GpibInstrument("GPIB%d::%d" % (board, GPIBaddr) if board else "GPIB::%d" % GPIBaddr)
+            self.transport = transport
+            self._initialize(reset)
             self._clearData()
             self.saveCounter = 0
+            self.initialized = True
         except VisaIOError:
             print('VisaIOError - is the keithley turned on?')
 
+    # pass anything not defined here (timeout, clear, close, ...) on to the transport
+    def __getattr__(self, name):
+        if name == 'transport':
+            raise AttributeError(name)
+        return getattr(self.transport, name)
+
+    ###################################################################################
+    # Data views: columns of the measurement buffer, kept for compatibility w/ old code #
+    ###################################################################################
+
+    # every value from every reading, flattened to (V, I, I/V, time, ?, V, I, ...)
+    @property
+    def dataAll(self):
+        return self.buffer.rows().ravel()
+
+    @property
+    def dataVolt(self):
+        return self.buffer.column('volts')
+
+    @property
+    def dataCurr(self):
+        return self.buffer.column('amps')
+
+    @property
+    def dataRes(self):
+        return self.buffer.column('ohms')
+
+    @property
+    def dataTime(self):
+        return self.buffer.column('time')
+
+    @property
+    def data(self):
+        return {'volts': self.dataVolt, 'amps': self.dataCurr, 'ohms': self.dataRes}
+
+    # standard deviation of each reading in dataCurr, when averaging w/ setAveraging('trace', ..., deviation=True)
+    @property
+    def dataCurrDev(self):
+        return self.deviations.column('amps')
+
     #####################################################################################################
     # Internal methods: these are used internally but shouldn't be necessary for basic use of the class #
     #####################################################################################################
 
     # do setup stuff I don't really understand
     # adapted from http://pyvisa.sourceforge.net/pyvisa.html#a-more-complex-example
-    def _initialize(self):
-	self.write("*RST")
-        self.write("*CLS")
-        self.write("STATUS:MEASUREMENT:ENABLE 512")
-        self.write("*SRE 1")
-        self.write("ARM:COUNT 1")
-        self.write("ARM:SOURCE BUS")
-        self.write("TRACE:FEED SENSE1")
-	self.write("SYSTEM:TIME:RESET:AUTO 0")
-
-        # set various things to default values
-        #self.setDelay()
-        self.setNumPoints()
+    # w/o reset the Keithley keeps its source, measure and sweep setup and the shadowed state is read back
+    # from it instead; only the status, arm and trace settings this class relies on are written
+    def _initialize(self, reset=True):
+        with self.batch():
+            if reset:
+                self.write("*RST")
+            self.invalidateState()
+            self.write("*CLS")
+            self.write("STATUS:MEASUREMENT:ENABLE 512")
+            self.write("*SRE 1")
+            self.write("ARM:COUNT 1")
+            self.write("ARM:SOURCE BUS")
+            self.write("TRACE:FEED SENSE1")
+            self.write("SYSTEM:TIME:RESET:AUTO 0")
+
+            # set various things to default values
+            #self.setDelay()
+            if reset:
+                self.setNumPoints()
+            self.setDataFormat(self.dataFormat, self.byteOrder)
+        if not reset:
+            self.resyncState()
 
     # clear the saved data from previous measurement
     def _clearData(self):
-        self.dataAll = []
-        self.dataVolt = []
-        self.dataCurr = []
-        self.dataRes = []
-        self.dataTime = []
-        self.data = {}
+        self.buffer.clear()
+        self.deviations.clear()
+        self.dataTemp = []
 
     # start a measurement and wait for the 'measurement is done' signal from the Keithley
     def _startMeasurement(self):
@@ -91,38 +245,188 @@ class Keithley2400(GpibInstrument):
 
     # start a measurement
     def _startNoWait(self):
-        self.write("OUTPUT ON")
-        self.write("TRACE:FEED:CONTROL NEXT")
-        self.write("INIT")
+        with self.batch():
+            self._setState("OUTPUT", "ON")
+            self.write("TRACE:FEED:CONTROL NEXT")
+            self.write("INIT")
         self.trigger()
 
     # catch the 'measurement is done' signal from the Keithely
-    def _catchSRQ(self):
-        self.wait_for_srq(None)
+    # waits forever by default, otherwise the transport raises an error after timeout seconds
+    def _catchSRQ(self, timeout=None):
+        if self.srqPolling:
+            self._pollSRQ(timeout)
+        else:
+            self.wait_for_srq(timeout)
         self.ask("STATUS:MEASUREMENT?")
 
+    # wait for the 'measurement is done' summary bit of the status byte by polling it
+    # the bus isn't tied up while waiting, so the other Keithleys on the board can carry on (see instrumentPool.py)
+    def _pollSRQ(self, timeout=None, pollInterval=DEFAULT_POLL_INTERVAL):
+        startTime = _clock()
+        while not int(self.ask("*STB?")) & 1:
+            if timeout is not None and _clock() - startTime > timeout:
+                raise VisaIOError(VI_ERROR_TMO)
+            time.sleep(pollInterval)
+
     # pull data from the Keithley
     # always call this before _stopMeasurement() bc _stopMeasurement clears the keithley's buffer
     def _pullData(self):
+        if self.averaging == 'trace':
+            return self._pullStatistics()
         # returns (V, I, I/V, time, ?) for each data point
         # (at least when measuring resistance)
         # when not measuring resistance, I/V column = 9.91e37
-        self.dataTemp = self.ask_for_values("TRACE:DATA?")
+        self.dataTemp = self.buffer.append(self._readTrace()).ravel()
+        return self.dataTemp
+
+    # pull the mean of the readings in the Keithley's buffer rather than the readings themselves, as a
+    # single (V, I, I/V, time, ?) reading; their standard deviation goes to self.deviations if asked for
+    def _pullStatistics(self):
+        self.dataTemp = self.buffer.append(self._readStatistic("MEAN")).ravel()
+        if self.averageDeviation:
+            self.deviations.append(self._readStatistic("SDEV"))
+        return self.dataTemp
+
+    # one statistic (MEAN, SDEV, MAX, MIN, PKPK) of the buffer from CALC3, changing CALC3:FORMAT in the same write
+    def _readStatistic(self, statistic):
+        query = "CALC3:DATA?"
+        if self.state.get("CALC3:FORMAT") != statistic:
+            query = "CALC3:FORMAT " + statistic + ";:" + query
+            self.state["CALC3:FORMAT"] = statistic
+        return self._readValues(query)
 
-        self.dataAll += self.dataTemp
-        self.dataVolt += self.dataTemp[0::5]
-        self.dataCurr += self.dataTemp[1::5]
-        self.dataRes += self.dataTemp[2::5]
-        self.dataTime += self.dataTemp[3::5]
-        self.data = {'volts':self.dataVolt, 'amps':self.dataCurr, 'ohms':self.dataRes}
+    # read the whole Keithley buffer as a flat sequence of (V, I, I/V, time, ?) values
+    def _readTrace(self):
+        return self._readValues("TRACE:DATA?")
+
+    # send a query for data in the current data format
+    # ascii transfers come back as a list, binary transfers as a numpy array
+    def _readValues(self, query):
+        if self.dataFormat == 'ascii':
+            return self.ask_for_values(query)
+        self.write(query)
+        return self._parseBlock(self.read_raw())
+
+    # decode an IEEE 488.2 block into a numpy array, either definite length ('#' <n> <n digit byte count> <data>)
+    # or indefinite length ('#0' <data> <terminator>), which is what the 2400 sends
+    def _parseBlock(self, raw):
+        start = raw.find(b'#')
+        numDigits = int(raw[start + 1:start + 2])
+        offset = start + 2 + numDigits
+        if numDigits:
+            numBytes = int(raw[start + 2:offset])
+        else:
+            # the data runs to the end, the terminator is shorter than a value so it's left out by rounding down
+            numBytes = len(raw) - offset
+        dtype = numpy.dtype(BYTE_ORDERS[self.byteOrder][1] + DATA_FORMATS[self.dataFormat][1])
+        return numpy.frombuffer(raw, dtype=dtype, count=numBytes // dtype.itemsize, offset=offset)
 
-	return self.dataTemp
+    # write a setting, unless the Keithley is already known to have that setting
+    # the setting is remembered in self.state under key, by default the command is "key value"
+    def _setState(self, key, value, command=None):
+        if self.state.get(key) == value:
+            return
+        self.write(command if command is not None else key + " " + value)
+        self.state[key] = value
+
+    # wait until the Keithley's buffer holds numPts readings, polling the fill count
+    def _waitForPoints(self, numPts, pollInterval=DEFAULT_POLL_INTERVAL):
+        while self.getPointsTaken() < numPts:
+            time.sleep(pollInterval)
 
     # stop a measurement, turn output off
     def _stopMeasurement(self):
-        self.write("OUTPUT OFF")
-        self.write("TRACE:CLEAR")
-        self.ask("STATUS:MEASUREMENT?")
+        with self.batch():
+            self.outputOff()
+            self.write("TRACE:CLEAR")
+            self.ask("STATUS:MEASUREMENT?")
+
+    #######################################################################
+    # Bus methods: every transaction with the Keithley goes through these #
+    #######################################################################
+
+    # queue writes made inside a 'with k.batch():' block and send them as a few ';' joined writes
+    # queries, reads and triggers send whatever is queued first, so replies always come back in order
+    @contextmanager
+    def batch(self):
+        self._batchDepth += 1
+        try:
+            yield self
+        finally:
+            self._batchDepth -= 1
+            if self._batchDepth == 0:
+                self.flush()
+
+    # send any queued writes, joined with ';' into as few bus writes as maxBatchLength allows
+    def flush(self):
+        queue, self._batchQueue = self._batchQueue, []
+        message = ''
+        for command in queue:
+            # a leading ':' resets the SCPI path so each command is read from the root of the tree
+            if not command.startswith((':', '*')):
+                command = ':' + command
+            if message and len(message) + len(command) + 1 > self.maxBatchLength:
+                with self.busLock:
+                    self.transport.write(message)
+                message = ''
+            message = message + ';' + command if message else command
+        if message:
+            with self.busLock:
+                self.transport.write(message)
+
+    def write(self, message):
+        if self._batchDepth:
+            self._batchQueue.append(message)
+        else:
+            with self.busLock:
+                self.transport.write(message)
+
+    def ask(self, message):
+        with self.busLock:
+            self.flush()
+            self.transport.write(message)
+            return self.read()
+
+    def ask_for_values(self, message, format=None):
+        with self.busLock:
+            self.flush()
+            self.transport.write(message)
+            return self.read_values(format)
+
+    def read(self):
+        with self.busLock:
+            self.flush()
+            return self.transport.read()
+
+    def read_raw(self):
+        with self.busLock:
+            self.flush()
+            return self.transport.read_raw()
+
+    def read_values(self, format=None):
+        with self.busLock:
+            self.flush()
+            return self.transport.read_values(format)
+
+    def trigger(self):
+        with self.busLock:
+            self.flush()
+            self.transport.trigger()
+
+    # record every bus transaction with tracer (see scpiTracer.py), setTracer(None) stops recording
+    # the tracer wraps the transport, so nothing is added to the bus methods when it is off
+    def setTracer(self, tracer):
+        from scpiTracer import TracingTransport  # scpiTracer imports keithley
+        transport = self.transport
+        if isinstance(transport, TracingTransport):
+            transport = transport.transport
+        self.transport = TracingTransport(transport, tracer, self) if tracer is not None else transport
+
+    # the bus lock isn't held while waiting, use srqPolling when several threads share a board
+    def wait_for_srq(self, timeout=25):
+        self.flush()
+        self.transport.wait_for_srq(timeout)
 
     ##############################################################
     # Configuration methods: use these to configure the Keithley #
@@ -130,67 +434,233 @@ class Keithley2400(GpibInstrument):
 
     # set the number of data points to take
     def setNumPoints(self, numPts=DEFAULT_NUM_POINTS):
-        self.write("TRIGGER:COUNT %d" % numPts)
-        self.write("TRACE:POINTS %d" % numPts)
+        self._setState("TRIGGER:COUNT", "%d" % numPts)
+        self._setState("TRACE:POINTS", "%d" % numPts)
 
     # set the delay between data points (in sec)
     def setDelay(self, delay=DEFAULT_TIME_STEP):
-        self.write("TRIGGER:DELAY %f" % delay)
+        self._setState("TRIGGER:DELAY", "%f" % delay)
+
+    # set how the buffer is transferred, expects dataFormat to be one of 'ascii', 'real32', 'real64'
+    # and byteOrder to be 'swapped' (little-endian) or 'normal' (big-endian)
+    # binary formats are much faster to transfer for long sweeps, ascii is the instrument default
+    def setDataFormat(self, dataFormat=DEFAULT_DATA_FORMAT, byteOrder=DEFAULT_BYTE_ORDER):
+        if dataFormat not in DATA_FORMATS or byteOrder not in BYTE_ORDERS:
+            print("Expected data format in [ascii, real32, real64] and byte order in [normal, swapped]")
+            return
+        self.write("FORMAT:DATA " + DATA_FORMATS[dataFormat][0])
+        if dataFormat != 'ascii':
+            self.write("FORMAT:BORDER " + BYTE_ORDERS[byteOrder][0])
+        self.dataFormat = dataFormat
+        self.byteOrder = byteOrder
 
     # set DC source, expects source to be either "voltage" or "current"
     def setSourceDC(self, source, value=0):
-        if (self.getMeasure()=='RES'):
-            self.write("SENSE:RESISTANCE:MODE MANUAL")
+        with self.batch():
+            if (self.getMeasure()=='RES'):
+                self._setState("SENSE:RESISTANCE:MODE", "MANUAL")
+            if source.lower() == "voltage":
+                self._setState("SOURCE:FUNCTION:MODE", "VOLT", "SOURCE:FUNCTION:MODE VOLTAGE")
+                self._setState("SOURCE:VOLTAGE:MODE", "FIXED")
+                self._setState("SOURCE:VOLTAGE:RANGE", str(value))
+                self._setState("SOURCE:VOLTAGE:LEVEL", str(value))
+            elif source.lower() == "current":
+                self._setState("SOURCE:FUNCTION:MODE", "CURR", "SOURCE:FUNCTION:MODE CURRENT")
+                self._setState("SOURCE:CURRENT:MODE", "FIXED")
+                self._setState("SOURCE:CURRENT:RANGE", str(value))
+                self._setState("SOURCE:CURRENT:LEVEL", str(value))
+
+    # average readings on the Keithley rather than on the computer, so only the averages cross the bus
+    # mode 'repeat' turns on the 2400's repeating averaging filter, each reading it takes is then the mean of
+    # count conversions; 'moving' averages each reading w/ the count - 1 before it (a running average)
+    # mode 'trace' takes count readings into the buffer per measurement (so sets the number of points) and
+    # pulls only their mean, and their standard deviation into self.deviations w/ deviation=True
+    # mode None goes back to pulling every reading
+    def setAveraging(self, mode='repeat', count=DEFAULT_AVERAGE_COUNT, deviation=False):
+        if mode not in (None, 'trace') and mode not in AVERAGING_FILTERS:
+            print("Expected one of [repeat, moving, trace, None]")
+            return
+        if mode in AVERAGING_FILTERS and not 1 <= count <= MAX_FILTER_COUNT:
+            print("The averaging filter can only average 1 to %d readings" % MAX_FILTER_COUNT)
+            return
+        with self.batch():
+            if mode in AVERAGING_FILTERS:
+                self._setState("SENSE:AVERAGE:TCONTROL", AVERAGING_FILTERS[mode])
+                self._setState("SENSE:AVERAGE:COUNT", "%d" % count)
+                self._setState("SENSE:AVERAGE:STATE", "ON")
+            else:
+                self._setState("SENSE:AVERAGE:STATE", "OFF")
+            if mode == 'trace':
+                self.setNumPoints(count)
+        self.averaging = mode
+        self.averageDeviation = deviation and mode == 'trace'
+
+    # set how fast the Keithley takes readings, profile is one of SPEED_PROFILES ('fast', 'balanced', 'precise')
+    # w/ rate (readings per second) the most precise settings expected to keep up w/ it are chosen instead
+    # returns the expected readings per second; the settings, target and expected rate are kept in self.speedStats
+    # and achievedRate() adds the rate actually achieved once something has been measured
+    def setSpeed(self, profile='balanced', rate=None):
+        if rate is not None:
+            profile, settings = self._settingsForRate(rate)
+        elif profile in SPEED_PROFILES:
+            settings = SPEED_PROFILES[profile]
+        else:
+            print("Expected one of [fast, balanced, precise]")
+            return
+        with self.batch():
+            # the 2400 uses the same integration time for every function
+            self._setState("SENSE:CURRENT:NPLCYCLES", "%g" % settings['nplc'])
+            if settings['autoZero'] == 'ONCE':
+                self.write("SYSTEM:AZERO:STATE ONCE")
+                self.state["SYSTEM:AZERO:STATE"] = "OFF"
+            else:
+                self._setState("SYSTEM:AZERO:STATE", settings['autoZero'])
+            self._setState("DISPLAY:ENABLE", settings['display'])
+            self._setState("SENSE:CURRENT:RANGE:AUTO", settings['autoRange'])
+            self._setState("SENSE:VOLTAGE:RANGE:AUTO", settings['autoRange'])
+            if settings['sourceDelay'] == 'AUTO':
+                self._setState("SOURCE:DELAY:AUTO", "ON")
+            else:
+                self._setState("SOURCE:DELAY:AUTO", "OFF")
+                self._setState("SOURCE:DELAY", "%f" % settings['sourceDelay'])
+        self.speedStats = dict(settings, profile=profile, targetRate=rate)
+        self.speedStats['expectedRate'] = 1. / self._readingTime(settings)
+        return self.speedStats['expectedRate']
+
+    # the most precise speed settings expected to take rate readings per second, as (profile, settings)
+    # each profile is tried in turn from 'precise' to 'fast' w/ the longest integration time that fits
+    def _settingsForRate(self, rate):
+        for profile in ('precise', 'balanced', 'fast'):
+            settings = dict(SPEED_PROFILES[profile], nplc=0)
+            fixedTime = self._readingTime(settings)
+            perNPLC = self._readingTime(dict(settings, nplc=1)) - fixedTime
+            nplc = round(floor((1. / rate - fixedTime) / perNPLC / MIN_NPLC + 1E-9) * MIN_NPLC, 2)
+            if nplc >= MIN_NPLC:
+                settings['nplc'] = min(nplc, MAX_NPLC)
+                return profile, settings
+        print("%g readings/s is more than the Keithley can take, using the fastest settings" % rate)
+        return 'fast', SPEED_PROFILES['fast']
+
+    # estimated seconds per reading w/ the given speed settings, the trigger delay and the averaging filter
+    def _readingTime(self, settings):
+        conversions = AUTO_ZERO_CONVERSIONS if settings['autoZero'] == 'ON' else 1
+        if self.state.get("SENSE:AVERAGE:STATE") == "ON" and self.state.get("SENSE:AVERAGE:TCONTROL") == "REPEAT":
+            conversions *= int(self.state["SENSE:AVERAGE:COUNT"])
+        sourceDelay = AUTO_SOURCE_DELAY if settings['sourceDelay'] == 'AUTO' else settings['sourceDelay']
+        return (conversions * settings['nplc'] / float(self.lineFrequency) + READING_OVERHEAD + sourceDelay +
+                (DISPLAY_OVERHEAD if settings['display'] == 'ON' else 0) +
+                float(self.state.get("TRIGGER:DELAY", 0)))
+
+    # readings per second achieved in the last measurement, from the Keithley's timestamps
+    # uses the typical time between readings, so gaps between sweeps in the same buffer don't count
+    def achievedRate(self):
+        steps = numpy.diff(self.dataTime)
+        steps = steps[steps > 0]
+        if not len(steps):
+            return None
+        self.speedStats['achievedRate'] = 1. / numpy.median(steps)
+        return self.speedStats['achievedRate']
+
+    # set the source range, expects source to be either "voltage" or "current"
+    # use this rather than writing SOURCE:...:RANGE directly so the shadowed state stays valid
+    def setSourceRange(self, source, value):
         if source.lower() == "voltage":
-            self.write("SOURCE:FUNCTION:MODE VOLTAGE")
-            self.write("SOURCE:VOLTAGE:MODE FIXED")
-            self.write("SOURCE:VOLTAGE:RANGE " + str(value))
-            self.write("SOURCE:VOLTAGE:LEVEL " + str(value))
+            self._setState("SOURCE:VOLTAGE:RANGE", str(value))
         elif source.lower() == "current":
-            self.write("SOURCE:FUNCTION:MODE CURRENT")
-            self.write("SOURCE:CURRENT:MODE FIXED")
-            self.write("SOURCE:CURRENT:RANGE " + str(value))
-            self.write("SOURCE:CURRENT:LEVEL " + str(value))
+            self._setState("SOURCE:CURRENT:RANGE", str(value))
+        else:
+            print("Expected one of [current, voltage]")
 
     # set sweep source, expects source to be either "voltage" or "current"
     def setSourceSweep(self, source, startValue, stopValue, sourceStep, timeStep=DEFAULT_TIME_STEP):
-        numPts = ceil(abs((stopValue - startValue) / sourceStep)) + 1
-        if self.getMeasure() == 'RES':
-            self.write("SENSE:RESISTANCE:MODE MANUAL")
-        if source.lower() == "voltage":
-            self.write("SOURCE:FUNCTION:MODE VOLTAGE")
-            self.write("SOURCE:VOLTAGE:MODE SWEEP")
-            # self.write("SOURCE:VOLTAGE:RANGE " + str(stopValue))
-            self.write("SOURCE:VOLTAGE:START " + str(startValue))
-            self.write("SOURCE:VOLTAGE:STOP " + str(stopValue))
-            self.write("SOURCE:VOLTAGE:STEP " + str(sourceStep))
-            self.setNumPoints(numPts)
-            self.setDelay(timeStep)
-        elif source.lower() == "current":
-            self.write("SOURCE:FUNCTION:MODE CURRENT")
-            self.write("SOURCE:CURRENT:MODE SWEEP")
-            self.write("SOURCE:CURRENT:RANGE " + str(stopValue))
-            self.write("SOURCE:CURRENT:START " + str(startValue))
-            self.write("SOURCE:CURRENT:STOP " + str(stopValue))
-            self.write("SOURCE:CURRENT:STEP " + str(sourceStep))
-            self.setNumPoints(numPts)
-            self.setDelay(timeStep)
-        else:
-            print("Error: bad arguments")
+        numPts = sweepPoints(startValue, stopValue, sourceStep)
+        self.sweep = ('setSourceSweep', (source, startValue, stopValue, sourceStep, timeStep))
+        # make room for the whole sweep up front so _pullData never has to grow the buffer
+        self.buffer.reserve(len(self.buffer) + numPts)
+        with self.batch():
+            if self.getMeasure() == 'RES':
+                self._setState("SENSE:RESISTANCE:MODE", "MANUAL")
+            if source.lower() == "voltage":
+                self._setState("SOURCE:FUNCTION:MODE", "VOLT", "SOURCE:FUNCTION:MODE VOLTAGE")
+                self._setState("SOURCE:VOLTAGE:MODE", "SWEEP")
+                # self._setState("SOURCE:VOLTAGE:RANGE", str(stopValue))
+                self._setState("SOURCE:VOLTAGE:START", str(startValue))
+                self._setState("SOURCE:VOLTAGE:STOP", str(stopValue))
+                self._setState("SOURCE:VOLTAGE:STEP", str(sourceStep))
+                self.setNumPoints(numPts)
+                self.setDelay(timeStep)
+            elif source.lower() == "current":
+                self._setState("SOURCE:FUNCTION:MODE", "CURR", "SOURCE:FUNCTION:MODE CURRENT")
+                self._setState("SOURCE:CURRENT:MODE", "SWEEP")
+                self._setState("SOURCE:CURRENT:RANGE", str(stopValue))
+                self._setState("SOURCE:CURRENT:START", str(startValue))
+                self._setState("SOURCE:CURRENT:STOP", str(stopValue))
+                self._setState("SOURCE:CURRENT:STEP", str(sourceStep))
+                self.setNumPoints(numPts)
+                self.setDelay(timeStep)
+            else:
+                print("Error: bad arguments")
         return numPts
 
+    # set list source, expects source to be either "voltage" or "current"
+    # values can be any sequence of source levels, one per data point, e.g. a non-linear ramp or a hysteresis loop
+    # the 2400 holds at most MAX_BUFFER_POINTS values
+    def setSourceList(self, source, values, timeStep=DEFAULT_TIME_STEP):
+        values = list(values)
+        numPts = len(values)
+        self.buffer.reserve(len(self.buffer) + numPts)
+        self.sweep = ('setSourceList', (source, values, timeStep))
+        with self.batch():
+            if self.getMeasure() == 'RES':
+                self._setState("SENSE:RESISTANCE:MODE", "MANUAL")
+            if source.lower() == "voltage":
+                self._setState("SOURCE:FUNCTION:MODE", "VOLT", "SOURCE:FUNCTION:MODE VOLTAGE")
+                self._setState("SOURCE:VOLTAGE:MODE", "LIST")
+                self._setList("VOLTAGE", values)
+                self.setNumPoints(numPts)
+                self.setDelay(timeStep)
+            elif source.lower() == "current":
+                self._setState("SOURCE:FUNCTION:MODE", "CURR", "SOURCE:FUNCTION:MODE CURRENT")
+                self._setState("SOURCE:CURRENT:MODE", "LIST")
+                self._setState("SOURCE:CURRENT:RANGE", str(max(abs(value) for value in values)))
+                self._setList("CURRENT", values)
+                self.setNumPoints(numPts)
+                self.setDelay(timeStep)
+            else:
+                print("Error: bad arguments")
+        return numPts
+
+    # upload a source list, MAX_LIST_CHUNK values at a time, unless the Keithley already has it
+    def _setList(self, source, values):
+        key = "SOURCE:LIST:" + source
+        listText = [str(value) for value in values]
+        if self.state.get(key) == ','.join(listText):
+            return
+        self.write(key + " " + ','.join(listText[:MAX_LIST_CHUNK]))
+        for first in range(MAX_LIST_CHUNK, len(listText), MAX_LIST_CHUNK):
+            self.write(key + ":APPEND " + ','.join(listText[first:first + MAX_LIST_CHUNK]))
+        self.state[key] = ','.join(listText)
+
     # set what is being measured (VOLTage or CURRent or RESistance)
     def setMeasure(self, measure):
-        self.write("SENSE:FUNCTION:OFF 'CURR:DC', 'VOLT:DC', 'RES'")
-        if measure.lower() == "voltage":
-            self.write("SENSE:FUNCTION:ON 'VOLTAGE:DC'")
-        elif measure.lower() == "current":
-            self.write("SENSE:FUNCTION:ON 'CURRENT:DC'")
-        elif measure.lower() == "resistance":
-            self.write("SENSE:FUNCTION:ON 'CURRENT:DC'")
-            self.write("SENSE:FUNCTION:ON 'RESISTANCE'")
-        else:
-            print("Expected one of [current, voltage, or resistance]")
+        # what getMeasure() will return once the change is made
+        sensed = {'voltage': 'VOLT:DC', 'current': 'CURR:DC', 'resistance': 'RES'}.get(measure.lower())
+        if sensed is not None and self.state.get("SENSE:FUNCTION") == sensed:
+            return
+        with self.batch():
+            self.write("SENSE:FUNCTION:OFF 'CURR:DC', 'VOLT:DC', 'RES'")
+            if measure.lower() == "voltage":
+                self.write("SENSE:FUNCTION:ON 'VOLTAGE:DC'")
+            elif measure.lower() == "current":
+                self.write("SENSE:FUNCTION:ON 'CURRENT:DC'")
+            elif measure.lower() == "resistance":
+                self.write("SENSE:FUNCTION:ON 'CURRENT:DC'")
+                self.write("SENSE:FUNCTION:ON 'RESISTANCE'")
+            else:
+                print("Expected one of [current, voltage, or resistance]")
+            self.state.pop("SENSE:FUNCTION", None)
+            if sensed is not None:
+                self.state["SENSE:FUNCTION"] = sensed
 
     # set the upper limit for how much current / voltage will be sourced
     def setCompliance(self, source, limit):
@@ -203,7 +673,7 @@ class Keithley2400(GpibInstrument):
 
     # set resistance measurements to 4-wire
     def setFourWire(self):
-        if self.ask("SENSE:FUNCTION?").split(",")[-1].strip('"') == 'RES':
+        if self.getMeasure() == 'RES':
             self.write("SYSTEM:RSENSE ON")
             print('Resistance measurement changed to 4-wire')
         else:
@@ -211,7 +681,7 @@ class Keithley2400(GpibInstrument):
 
     # set resistance measurements to 2-wire
     def setTwoWire(self):
-        if self.ask("SENSE:FUNCTION?").split(",")[-1].strip('"') == 'RES':
+        if self.getMeasure() == 'RES':
             self.write("SYSTEM:RSENSE OFF")
             print('Resistance measurement changed to 2-wire')
         else:
@@ -219,30 +689,64 @@ class Keithley2400(GpibInstrument):
 
     # set triggering to use TLINK connections (for fastest linking of two Keithleys)
     def setTLINK(self, inputTrigs, outputTrigs):
-        self.write("TRIG:SOURCE TLINK")
-        self.write("TRIG:INPUT {}".format(inputTrigs))
-        self.write("TRIG:OUTPUT {}".format(outputTrigs))
+        with self.batch():
+            self._setState("TRIG:SOURCE", "TLINK")
+            self._setState("TRIG:INPUT", "{}".format(inputTrigs))
+            self._setState("TRIG:OUTPUT", "{}".format(outputTrigs))
 
     # set triggering to be immediate (default for single Keithley measurements)
     def setNoTLINK(self):
-        self.write("TRIG:SOURCE IMMEDIATE")
-        self.write("TRIG:INPUT NONE")
-        self.write("TRIG:OUTPUT NONE")
+        with self.batch():
+            self._setState("TRIG:SOURCE", "IMMEDIATE")
+            self._setState("TRIG:INPUT", "NONE")
+            self._setState("TRIG:OUTPUT", "NONE")
+
+    # forget everything known about the Keithley's settings
+    # call this after changing settings from the front panel or with raw write() calls
+    def invalidateState(self):
+        self.state = {}
+        self.sweep = None
+
+    # re-read the shadowed settings from the Keithley
+    def resyncState(self):
+        self.invalidateState()
+        self.getMeasure()
+        source = self.getSource()[0]
+        for key in ("SOURCE:%s:MODE" % source, "SOURCE:%s:RANGE" % source, "OUTPUT", "TRIGGER:COUNT",
+                    "TRACE:POINTS", "TRIGGER:DELAY", "TRIG:SOURCE", "TRIG:INPUT", "TRIG:OUTPUT"):
+            # the Keithley answers in its own short forms (e.g. '1' for 'ON'), so the first
+            # change of each setting may be written even if unneeded, but is never wrongly skipped
+            self.state[key] = self.ask(key + "?")
 
     # get what is being measured (VOLTage or CURRent or RESistance)
     def getMeasure(self):
-        # keithley returns something like ' "VOLT:DC", "RES" ' or ' "CURR:DC" '
-        return self.ask("SENSE:FUNCTION?").split(",")[-1].strip('"')
+        if "SENSE:FUNCTION" not in self.state:
+            # keithley returns something like ' "VOLT:DC", "RES" ' or ' "CURR:DC" '
+            self.state["SENSE:FUNCTION"] = self.ask("SENSE:FUNCTION?").split(",")[-1].strip('"')
+        return self.state["SENSE:FUNCTION"]
+
+    # get the number of readings stored in the Keithley's buffer so far
+    def getPointsTaken(self):
+        return int(float(self.ask("TRACE:POINTS:ACTUAL?")))
 
     # get what is being sourced (VOLTage or CURRent)
     # returns ['VOLTAGE'|'CURRENT', value in volts|amps]
     def getSource(self):
-        source = self.ask("SOURCE:FUNCTION:MODE?")
+        if "SOURCE:FUNCTION:MODE" not in self.state:
+            self.state["SOURCE:FUNCTION:MODE"] = self.ask("SOURCE:FUNCTION:MODE?")
+        source = self.state["SOURCE:FUNCTION:MODE"]
         if source == "VOLT":
             # sourceMode = self.ask("SOURCE:VOLTAGE:MODE?")
-            return ['VOLTAGE', self.ask_for_values("SOURCE:VOLTAGE:LEVEL?")[0]]
+            return ['VOLTAGE', self._getLevel('VOLTAGE')]
         elif source == "CURR":
-            return ['CURRENT', self.ask_for_values("SOURCE:CURRENT:LEVEL?")[0]]
+            return ['CURRENT', self._getLevel('CURRENT')]
+
+    # get the DC source level, expects source to be either 'VOLTAGE' or 'CURRENT'
+    def _getLevel(self, source):
+        key = "SOURCE:%s:LEVEL" % source
+        if key not in self.state:
+            self.state[key] = str(self.ask_for_values(key + "?")[0])
+        return float(self.state[key])
 
     ########################################################
     # Operation methods: use these to operate the Keithley #
@@ -250,19 +754,31 @@ class Keithley2400(GpibInstrument):
 
     # turn the output on
     def outputOn(self):
-	self.write("OUTPUT ON")
+        self._setState("OUTPUT", "ON")
 
     # turn the output off
+    # always sent, even if the shadowed state says it's off already: it may have been turned on from the
+    # front panel or w/ a raw write()
     def outputOff(self):
-	self.write("OUTPUT OFF")
+        self.write("OUTPUT OFF")
+        self.state["OUTPUT"] = "OFF"
 
     # read a single data point
     def measurePoint(self):
-        self.write("TRACE:FEED:CONTROL NEXT")
-        self.write("INIT")
+        with self.batch():
+            self.write("TRACE:FEED:CONTROL NEXT")
+            self.write("INIT")
         self.trigger()
         return self._pullData()
-	
+
+    # read a single data point w/o keeping it in self.buffer, returns its (V, I, I/V, time, ?) row
+    # for taking readings for days, see monitorLog.py
+    def readPoint(self):
+        with self.batch():
+            self.write("TRACE:FEED:CONTROL NEXT")
+            self.write("INIT")
+        self.trigger()
+        return numpy.asarray(self._readTrace(), dtype=float).reshape(-1, len(COLUMNS))
 
     # perform a measurement w/ current parameters
     def doMeasurement(self):
@@ -271,30 +787,152 @@ class Keithley2400(GpibInstrument):
         self._pullData()
         self._stopMeasurement()
 
-    # ramp the output from rampStart to rampTarget
-    def rampOutput(self, rampStart, rampTarget, step, timeStep=50E-3):
-        if rampTarget < rampStart: step = -abs(step)
-        if rampTarget > rampStart: step = abs(step)
+    # perform a sweep made of several legs, each a (start, stop, step) tuple, e.g. a hysteresis loop
+    # the legs are uploaded as one source list and run back to back from a single trigger, w/o the Keithley
+    # sitting idle while each leg is read out and the next one configured
+    # data from all the legs is appended to self.buffer in order; leaves the output on, call _stopMeasurement after
+    def doLegSweep(self, source, legs, timeStep=DEFAULT_TIME_STEP):
+        return self.doListSweep(source, legValues(legs), timeStep)
+
+    # perform a list sweep of any length; the keithley's buffer can only hold MAX_BUFFER_POINTS, so long
+    # lists are run in pieces one after the other. The output is left at values[-1], not the DC level it
+    # started from, so ramp it off from there. linked Keithleys, triggered over TLINK by this one (see
+    # setTLINK), take a reading at each point and are read out with it; a Keithley that doesn't finish within
+    # timeout seconds raises the transport's timeout error
+    # data is appended to self.buffer (and each linked Keithley's buffer); leaves the output on, call _stopMeasurement after
+    def doListSweep(self, source, values, timeStep=DEFAULT_TIME_STEP, linked=(), timeout=None):
+        values = list(values)
+        keithleys = [self] + list(linked)
+        levelKey = "SOURCE:" + source.upper() + ":LEVEL"
+        for first in range(0, len(values), MAX_BUFFER_POINTS):
+            piece = values[first:first + MAX_BUFFER_POINTS]
+            numPts = self.setSourceList(source, piece, timeStep)
+            for keithley in linked:
+                keithley.setNumPoints(numPts)
+            for keithley in keithleys:
+                keithley._startNoWait()
+            # the output goes back to the DC level after a sweep, so once it has started move that level
+            # to the end of the piece, which is where the next one starts
+            self._setState(levelKey, str(piece[-1]))
+            for keithley in keithleys:
+                keithley._catchSRQ(timeout)
+            for keithley in keithleys:
+                keithley._pullData()
+        return len(values)
+
+    # perform the sweep set up by setSourceSweep or setSourceList, yielding readings in chunks as they arrive
+    # each chunk is an array w/ one (V, I, I/V, time, ?) row per reading, collected in self.buffer like doMeasurement
+    # the 2400 can only transfer its whole buffer, so each chunk is run as a short sweep of its own;
+    # the next chunk is started before the last one is yielded, so saving or plotting it overlaps
+    # with the measurement. Leaves the output on, like _startMeasurement, call _stopMeasurement after
+    # pass source and values to run a list sweep w/o uploading the whole list w/ setSourceList first;
+    # it's then only recorded in self.sweep, so it can also be longer than MAX_BUFFER_POINTS
+    def iterSweep(self, chunkSize=DEFAULT_CHUNK_SIZE, pollInterval=DEFAULT_POLL_INTERVAL,
+                  source=None, values=None, timeStep=DEFAULT_TIME_STEP):
+        if values is not None:
+            self.sweep = ('setSourceList', (source, list(values), timeStep))
+        sweep = self.sweep
+        segments = self._sweepSegments(chunkSize)
+
+        self._clearData()
+        running = None  # the chunk started but not waited for yet
+        try:
+            self._startSegment(segments[0])
+            running = segments[0]
+            for i, (method, args, numPts) in enumerate(segments):
+                running = None
+                self._waitForPoints(numPts, pollInterval)
+                rows = self._pullData().reshape(-1, 5)
+                if i + 1 < len(segments):
+                    self._startSegment(segments[i + 1])
+                    running = segments[i + 1]
+                yield rows
+        finally:
+            # if the loop was left early the next chunk is already running, let it finish (it's at most
+            # chunkSize points) so the sweep isn't set up again underneath it
+            if running is not None:
+                self._waitForPoints(running[2], pollInterval)
+            # SRQ was never caught, so clear the 'buffer full' event before the next measurement
+            self.ask("STATUS:MEASUREMENT?")
+            # set the whole sweep up again, also when the loop was left early, unless it's too long to fit
+            # the Keithley's buffer, then it can only be run in chunks and stays in self.sweep for that;
+            # a sweep passed in as values was never set up, so it isn't uploaded here either
+            if values is None and sum(numPts for method, args, numPts in segments) <= MAX_BUFFER_POINTS:
+                getattr(self, sweep[0])(*sweep[1])
+            self.sweep = sweep
+
+    # split the sweep in self.sweep into (method, args, number of points) chunks of at most chunkSize points
+    def _sweepSegments(self, chunkSize):
+        method, args = self.sweep
+        if method == 'setSourceList':
+            source, values, timeStep = args
+            return [(method, (source, values[first:first + chunkSize], timeStep), len(values[first:first + chunkSize]))
+                    for first in range(0, len(values), chunkSize)]
+
+        source, startValue, stopValue, sourceStep, timeStep = args
+        numPts = sweepPoints(startValue, stopValue, sourceStep)
+        step = abs(sourceStep) if stopValue >= startValue else -abs(sourceStep)
+        segments = []
+        for first in range(0, numPts, chunkSize):
+            last = min(first + chunkSize, numPts) - 1
+            # the last chunk ends exactly at stopValue
+            chunkStop = stopValue if last == numPts - 1 else startValue + last * step
+            segments.append((method, (source, startValue + first * step, chunkStop, step, timeStep), last - first + 1))
+        return segments
+
+    # set up and start one chunk of iterSweep
+    def _startSegment(self, segment):
+        method, args, numPts = segment
+        getattr(self, method)(*args)
+        self._startNoWait()
+        # the output goes back to the DC level after a sweep, so once it has started move that level
+        # to the end of the chunk, which is where the next one starts, like doListSweep
+        source = args[0]
+        endValue = args[1][-1] if method == 'setSourceList' else args[2]
+        self._setState("SOURCE:" + source.upper() + ":LEVEL", str(endValue))
 
+    # ramp the output from rampStart to rampTarget
+    # the steps are sent against deadlines timeStep apart, so the time each command takes on the bus comes out
+    # of the wait rather than adding to it; the achieved rate is kept in self.rampStats
+    def rampOutput(self, rampStart, rampTarget, step, timeStep=DEFAULT_RAMP_TIME_STEP):
         source = self.getSource()[0]  # either 'voltage' or 'current'
-        sourceValue = rampStart
-        self.setSourceDC(source, sourceValue)
-        self.write("OUTPUT ON")
-        # hack-y : while (current level + step) is closer to target than current level
-        while abs((sourceValue + step) - rampTarget) <= abs(sourceValue - rampTarget):
-            sourceValue += step
-            self.setSourceDC(source, sourceValue)
-            time.sleep(timeStep)
+        values = rampValues(rampStart, rampTarget, step)
+        levelKey = "SOURCE:" + source.upper() + ":LEVEL"
+
+        with self.batch():
+            self.setSourceDC(source, rampStart)
+            # fix the range for the whole ramp so each step is a single level write
+            self.setSourceRange(source, max([abs(rampStart)] + [abs(v) for v in values]))
+            self.outputOn()
+
+        startTime = deadline = _clock()
+        for value in values:
+            wait = deadline - _clock()
+            if wait > 0:
+                time.sleep(wait)
+            self._setState(levelKey, str(value))
+            # if a step ran past the next deadline don't try to catch up, that would ramp faster than asked
+            deadline = max(deadline + timeStep, _clock())
+        wait = deadline - _clock()
+        if wait > 0:
+            time.sleep(wait)  # settle at the last level for one time step
+
+        sourceValue = values[-1] if values else rampStart
+        elapsed = _clock() - startTime
+        self.rampStats = {'steps': len(values),
+                          'seconds': elapsed,
+                          'rate': abs(sourceValue - rampStart) / elapsed if elapsed > 0 else 0,
+                          'targetRate': abs(step) / timeStep if timeStep > 0 else float('inf')}
         return sourceValue
 
     # starting with the output off, turn the output on then ramp the output up/down to a specified level
-    def rampOutputOn(self, rampTarget, step, timeStep=50E-3):
+    def rampOutputOn(self, rampTarget, step, timeStep=DEFAULT_RAMP_TIME_STEP):
         rampStart = 0
         sourceValue = self.rampOutput(rampStart, rampTarget, step, timeStep)
         return sourceValue
 
     # starting with the output on, ramp the output to 0, then turn the output off
-    def rampOutputOff(self, rampStart, step, timeStep=50E-3):
+    def rampOutputOff(self, rampStart, step, timeStep=DEFAULT_RAMP_TIME_STEP):
         rampTarget = 0
         sourceValue = self.rampOutput(rampStart, rampTarget, step, timeStep)
         self.outputOff()
@@ -302,21 +940,23 @@ class Keithley2400(GpibInstrument):
 
     # save the collected data to file
     # mode 'a' appends to existing file, mode 'i' increments file counter ie test0001.txt, test0002,txt
-    def saveData(self, filePath=DEFAULT_SAVE_PATH, fileName="test.txt", mode='i'):
+    # fileFormat 'columns' saves to a binary column store instead, ie test0001.cols, with the sweep appended
+    # as is and the shadowed instrument settings kept alongside it
+    def saveData(self, filePath=DEFAULT_SAVE_PATH, fileName="test.txt", mode='i', fileFormat=DEFAULT_FILE_FORMAT):
         if filePath[-1] != '/': filePath += '/'
         if fileName[-4:] != '.txt': fileName += '.txt'
 
+        if fileFormat == 'columns':
+            return self._saveColumns(filePath, fileName, mode)
+        elif fileFormat != 'text':
+            print("invalid file format")
+            return -1
+
         if mode == 'a':
             saveFile = open(filePath + fileName, "a+")
         elif mode == "i":
-            self.saveCounter = 0
-            while True:
-                self.saveCounter += 1
-                # print("checking file: " + filePath + fileName[:-4] + "{:04d}".format(self.saveCounter) + ".txt")
-                # print("")
-                if not os.path.exists(filePath + fileName[:-4] + "{:04d}".format(self.saveCounter) + ".txt"):
-                    break
-            saveFile = open(filePath + fileName[:-4] + "{:04d}".format(self.saveCounter) + ".txt", "a+")
+            savePath, self.saveCounter = openCatalog(filePath).nextPath(fileName[:-4], ".txt")
+            saveFile = open(savePath, "a+")
         else:
             print("invalid mode")
             return -1
@@ -330,17 +970,129 @@ class Keithley2400(GpibInstrument):
         saveFile.write("\n")
         saveFile.write(DEFAULT_ROW_FORMAT_HEADER.format("volts", "amps", "ohms", "s", "?"))
         saveFile.write("\n")
-        for row in chunks(self.dataAll, 5):
+        for row in self.buffer.rows():
             saveFile.write(DEFAULT_ROW_FORMAT_DATA.format(*row))
             saveFile.write("\n")
         saveFile.close()
-	return saveFile.name
+        if mode == "i":
+            self._catalogRun(filePath, saveFile.name)
+        return saveFile.name
+
+    # append the collected data to a column store, see saveData
+    def _saveColumns(self, filePath, fileName, mode='i'):
+        if mode == 'a':
+            storePath = filePath + fileName[:-4] + STORE_EXTENSION
+        elif mode == "i":
+            storePath, self.saveCounter = openCatalog(filePath).nextPath(fileName[:-4], STORE_EXTENSION)
+        else:
+            print("invalid mode")
+            return -1
+
+        store = ColumnWriter(storePath, COLUMNS, UNITS)
+        store.append([self.buffer.column(name) for name in COLUMNS], settings=dict(self.state))
+        if mode == "i":
+            self._catalogRun(filePath, storePath)
+        return storePath
+
+    # record a saved run in the data directory's run catalog (see runCatalog.py), with the shadowed
+    # instrument settings and the sweep parameters so it can be found later w/o opening the file
+    # settings that are numbers are recorded as numbers so they can be matched by range; source lists are
+    # recorded as their start, stop, step and extremes rather than as the text sent to the Keithley
+    def _catalogRun(self, filePath, savePath):
+        params = {}
+        for key, value in self.state.items():
+            if key.startswith("SOURCE:LIST"):
+                continue
+            try:
+                params[key] = float(value)
+            except (TypeError, ValueError):
+                params[key] = value
+        params['numPoints'] = len(self.buffer)
+        if self.sweep is not None:
+            params['sweep'] = self.sweep[0]
+            if self.sweep[0] == 'setSourceSweep':
+                source, startValue, stopValue, sourceStep, timeStep = self.sweep[1]
+                params.update({'source': source, 'start': float(startValue), 'stop': float(stopValue),
+                               'step': abs(float(sourceStep)), 'timeStep': float(timeStep)})
+            else:
+                source, values, timeStep = self.sweep[1]
+                steps = numpy.abs(numpy.diff(values))
+                steps = steps[steps > 0]
+                params.update({'source': source, 'start': float(values[0]), 'stop': float(values[-1]),
+                               'step': float(steps.min()) if len(steps) else 0.0,
+                               'min': float(min(values)), 'max': float(max(values)),
+                               'numValues': len(values), 'timeStep': float(timeStep)})
+        times = self.dataTime
+        timings = {'duration': float(times[-1] - times[0]) if len(times) else 0}
+        return openCatalog(filePath).record(savePath, params, {'keithley': self.GPIBaddr}, timings)
 
     def printSummary(self):
         print("Measuring: " + self.getMeasure())
         print("Sourcing: " + str(self.getSource()))
         print("")
         print(DEFAULT_ROW_FORMAT_HEADER.format("V (volts)", "I (amps)", "I/V (ohms)", "t (s)", "?"))
-        for row in chunks(self.dataAll, 5):
+        for row in self.buffer.rows():
             print(DEFAULT_ROW_FORMAT_DATA.format(*row))
         print("")
+
+
+##########################################################################
+# Session registry: one Keithley2400 per address for the whole process #
+##########################################################################
+
+_sessions = {}
+_sessionsLock = threading.Lock()
+
+
+# the open Keithley2400 at GPIBaddr on GPIB board board, opened the first time it is asked for
+# later calls return the same object, so its shadowed settings stay valid and the Keithley isn't reset again
+# a different transport than the open one opens a new session; reset=False attaches w/o *RST on first open
+def openKeithley(GPIBaddr, board=0, transport=None, reset=True, **kwargs):
+    from scpiTracer import TracingTransport  # scpiTracer imports keithley
+    key = (board, GPIBaddr)
+    with _sessionsLock:
+        keithley = _sessions.get(key)
+        # a traced Keithley's own transport is inside the TracingTransport
+        current = getattr(keithley, 'transport', None)
+        current = current.transport if isinstance(current, TracingTransport) else current
+        if keithley is None or not keithley.initialized or (transport is not None and transport is not current):
+            _sessions.pop(key, None)
+            keithley = Keithley2400(GPIBaddr, transport=transport, board=board, reset=reset, **kwargs)
+            if not keithley.initialized:
+                return keithley  # couldn't be set up, don't keep it so the next call tries again
+            _sessions[key] = keithley
+        return keithley
+
+
+# the Keithley2400 openKeithley has open at GPIBaddr on GPIB board board, None if there isn't one
+def getKeithley(GPIBaddr, board=0):
+    with _sessionsLock:
+        keithley = _sessions.get((board, GPIBaddr))
+        return keithley if keithley is not None and keithley.initialized else None
+
+
+# close keithley and drop it from the registry, so the next openKeithley for its address opens it again
+def closeKeithley(keithley):
+    with _sessionsLock:
+        key = (keithley.board, keithley.GPIBaddr)
+        if _sessions.get(key) is keithley:
+            del _sessions[key]
+    try:
+        keithley.flush()
+        keithley.close()
+    except Exception:
+        pass  # nothing more to be done with a Keithley that has gone away
+
+
+# close every Keithley opened w/ openKeithley, done automatically when python exits
+def closeSessions():
+    with _sessionsLock:
+        for keithley in _sessions.values():
+            try:
+                keithley.flush()
+                keithley.close()
+            except Exception:
+                pass  # nothing more to be done with a Keithley that has gone away
+        _sessions.clear()
+
+atexit.register(closeSessions)
@@ -0,0 +1,109 @@
+# a live plot of a sweep in progress, i.e.
+# >>> monitor = LiveMonitor(['bs', 'ro'], xlabel='Gate voltage (V)', ylabel='Current (A)')
+# >>> monitor.append(0, [Vgate], [Isd])  # cheap, call it for every new point or chunk
+# >>> monitor.refresh()  # draw whatever is still pending, e.g. at the end of the sweep
+#
+# new points are added to the existing lines and only the lines are redrawn (blitted) over a saved copy
+# of the axes, at most once every refreshInterval seconds, so watching a sweep costs the sweep very little.
+# once a line holds more than maxPoints it is decimated to the min and max of each bin (see plotRender.py),
+# so a monitor left running for hours stays responsive
+
+import time
+
+import numpy
+import matplotlib.pyplot as plt
+
+from plotRender import decimate
+
+DEFAULT_REFRESH_INTERVAL = 0.2  # seconds between redraws
+DEFAULT_MAX_POINTS = 4000  # points per line before it is decimated
+
+
+class LiveMonitor(object):
+    """A pyplot window showing sweep data as it comes in"""
+
+    # styles has one matplotlib format string per line, e.g. ['bs', 'ro']
+    # xlim fixes the x axis, otherwise both axes grow to fit the data
+    def __init__(self, styles=('b-',), title=None, xlabel=None, ylabel=None, xlim=None,
+                 refreshInterval=DEFAULT_REFRESH_INTERVAL, maxPoints=DEFAULT_MAX_POINTS):
+        self.refreshInterval = refreshInterval
+        self.maxPoints = maxPoints
+        self.xlim = xlim
+
+        self.figure, self.axes = plt.subplots()
+        # animated lines are left out of full redraws, they are drawn over the saved background instead
+        self.lines = [self.axes.plot([], [], style, animated=True)[0] for style in styles]
+        if title is not None: self.axes.set_title(title)
+        if xlabel is not None: self.axes.set_xlabel(xlabel)
+        if ylabel is not None: self.axes.set_ylabel(ylabel)
+        if xlim is not None: self.axes.set_xlim(xlim)
+
+        self.x = [numpy.empty(0) for line in self.lines]
+        self.y = [numpy.empty(0) for line in self.lines]
+        self.pending = [([], []) for line in self.lines]
+        self.lastRefresh = 0
+        self.background = None
+
+        self.canvas = self.figure.canvas
+        self.canvas.mpl_connect('draw_event', self._onDraw)
+        plt.show(block=False)
+        self.canvas.draw()
+
+    # save the axes w/o the lines after every full redraw (first draw, rescale, window resize)
+    def _onDraw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+        self._drawLines()
+
+    def _drawLines(self):
+        for line in self.lines:
+            self.axes.draw_artist(line)
+
+    # add points to line number i, redraws if it is more than refreshInterval since the last redraw
+    def append(self, i, x, y):
+        self.pending[i][0].extend(x)
+        self.pending[i][1].extend(y)
+        if time.time() - self.lastRefresh >= self.refreshInterval:
+            self.refresh()
+
+    # move the pending points onto the lines and redraw them
+    def refresh(self):
+        for i, line in enumerate(self.lines):
+            newX, newY = self.pending[i]
+            if newX:
+                self.x[i] = numpy.concatenate((self.x[i], newX))
+                self.y[i] = numpy.concatenate((self.y[i], numpy.asarray(newY, dtype=float)))
+                self.pending[i] = ([], [])
+                if len(self.x[i]) > self.maxPoints:
+                    # down to half of maxPoints, so this only happens every so often
+                    self.x[i], self.y[i] = decimate(self.x[i], self.y[i], self.maxPoints // 4)
+                line.set_data(self.x[i], self.y[i])
+
+        if self._outOfView():
+            # the axes have to change, which needs a full redraw (and a new background)
+            self.axes.relim()
+            self.axes.autoscale_view(scalex=self.xlim is None)
+            self.canvas.draw()
+        elif self.background is not None:
+            self.canvas.restore_region(self.background)
+            self._drawLines()
+            self.canvas.blit(self.axes.bbox)
+        self.canvas.flush_events()
+        self.lastRefresh = time.time()
+
+    # True if any of the points are outside the current axes limits
+    def _outOfView(self):
+        xs = [x for x in self.x if len(x)]
+        ys = [y[numpy.isfinite(y)] for y in self.y if len(y)]
+        ys = [y for y in ys if len(y)]
+        if not ys:
+            return False
+        yLow, yHigh = self.axes.get_ylim()
+        if min(y.min() for y in ys) < yLow or max(y.max() for y in ys) > yHigh:
+            return True
+        if self.xlim is None:
+            xLow, xHigh = self.axes.get_xlim()
+            return min(x.min() for x in xs) < xLow or max(x.max() for x in xs) > xHigh
+        return False
+
+    def close(self):
+        plt.close(self.figure)
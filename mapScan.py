@@ -0,0 +1,125 @@
+# two dimensional maps, e.g. source-drain current against gate voltage and bias, i.e.
+# >>> gate, sd = openKeithley(24), openKeithley(23)
+# >>> sd.setMeasure('current')
+# >>> mapScan(gate, 'voltage', numpy.arange(-10, 10.01, 0.5), sd, 'voltage', numpy.arange(-5E-3, 5.01E-3, 1E-4),
+# ...         'C:/Data/map0001.cols')
+# >>> outerValues, innerValues, grid = loadMap('C:/Data/map0001.cols')
+# >>> grid['amps']  # one row per gate voltage, one column per bias
+#
+# the outer Keithley (the gate) is stepped from one line to the next, and the inner Keithley (the bias) runs
+# each line as a list sweep on its own. Lines alternate direction (serpentine), so each starts where the last
+# one ended and nothing is ramped back to zero between them; only the outer value is ramped, one line's worth.
+# each line is appended to a column store (see columnStore.py) as soon as it is done. Running the same scan
+# on an existing store carries on after the last complete line, e.g. after a crash or ctrl-c
+
+from __future__ import print_function
+
+import time
+
+import numpy
+
+from keithley import MAX_BUFFER_POINTS, DEFAULT_TIME_STEP
+from columnStore import ColumnReader, ColumnWriter, storeExists
+from dataBuffer import COLUMNS, UNITS
+
+DEFAULT_OUTER_RAMP_STEP = 100E-3  # e.g. gate volts
+DEFAULT_INNER_RAMP_STEP = 1E-4  # e.g. source-drain volts
+DEFAULT_SETTLE_TIME = 0  # seconds to wait after stepping the outer Keithley, before the line
+MAP_COLUMNS = ('outer', 'inner') + COLUMNS
+SOURCE_UNITS = {'voltage': 'volts', 'current': 'amps'}
+
+
+# the inner values of line number line, reversed on every other line
+def lineValues(innerValues, line):
+    return list(innerValues) if line % 2 == 0 else list(innerValues)[::-1]
+
+
+# lines already in the store at path, None if the store was made for a different scan
+def _linesDone(path, settings):
+    if not storeExists(path):
+        return set()
+    store = ColumnReader(path)
+    for key, value in settings.items():
+        if store.settings.get(key) != value:
+            print("store " + path + " has a different " + key + ", not resuming")
+            return None
+    return set(sweep['settings']['line'] for sweep in store.sweeps)
+
+
+# scan outerValues on outerKeithley, and for each run a sweep over innerValues on innerKeithley
+# the readings of each line, w/ the outer and inner source values, are appended to the column store at path
+# returns the numbers of the lines measured (lines already in the store are skipped)
+def mapScan(outerKeithley, outerSource, outerValues, innerKeithley, innerSource, innerValues, path,
+            timeStep=DEFAULT_TIME_STEP, outerRampStep=DEFAULT_OUTER_RAMP_STEP, innerRampStep=DEFAULT_INNER_RAMP_STEP,
+            settleTime=DEFAULT_SETTLE_TIME):
+    outerValues = [float(value) for value in outerValues]
+    innerValues = [float(value) for value in innerValues]
+    if len(innerValues) > MAX_BUFFER_POINTS:
+        print("a line can have at most " + str(MAX_BUFFER_POINTS) + " points")
+        return []
+    settings = {'outerSource': outerSource, 'outerValues': outerValues,
+                'innerSource': innerSource, 'innerValues': innerValues, 'timeStep': timeStep}
+    done = _linesDone(path, settings)
+    if done is None:
+        return []
+    lines = [line for line in range(len(outerValues)) if line not in done]
+    if not lines:
+        return []
+
+    store = ColumnWriter(path, MAP_COLUMNS, (SOURCE_UNITS[outerSource], SOURCE_UNITS[innerSource]) + UNITS, settings)
+    outerLevelKey = "SOURCE:" + outerSource.upper() + ":LEVEL"
+    innerLevelKey = "SOURCE:" + innerSource.upper() + ":LEVEL"
+
+    # both outputs are expected to be off, like rampOutputOn
+    outerKeithley.setSourceDC(outerSource, 0)
+    innerKeithley.setSourceDC(innerSource, 0)
+    outer = outerKeithley.rampOutputOn(outerValues[lines[0]], outerRampStep)
+    inner = innerKeithley.rampOutputOn(lineValues(innerValues, lines[0])[0], innerRampStep)
+    measured = []
+    try:
+        for line in lines:
+            values = lineValues(innerValues, line)
+            if outer != outerValues[line]:
+                outerKeithley.rampOutput(outer, outerValues[line], outerRampStep)
+                # the ramp stops within half a step of the target
+                outerKeithley._setState(outerLevelKey, str(outerValues[line]))
+                outer = outerValues[line]
+                time.sleep(settleTime)
+
+            innerKeithley.setSourceList(innerSource, values, timeStep)
+            innerKeithley._clearData()
+            innerKeithley._startNoWait()
+            # the output goes back to the DC level after a sweep, so once it has started move that level
+            # to the end of the line, which is where the next line starts
+            innerKeithley._setState(innerLevelKey, str(values[-1]))
+            inner = values[-1]
+            innerKeithley._catchSRQ()
+            rows = numpy.asarray(innerKeithley._pullData()).reshape(-1, len(COLUMNS))
+            innerKeithley.write("TRACE:CLEAR")
+
+            store.append([numpy.ones(len(values)) * outer, values] + list(rows.T),
+                         settings={'line': line, 'outer': outer, 'reversed': line % 2 == 1})
+            measured.append(line)
+    finally:
+        # ends at the outer value reached, even if interrupted
+        innerKeithley.rampOutputOff(inner, innerRampStep)
+        outerKeithley.rampOutputOff(outer, outerRampStep)
+        innerKeithley._stopMeasurement()
+        outerKeithley._stopMeasurement()
+    return measured
+
+
+# a map saved by mapScan as (outerValues, innerValues, grid), grid is a dict of column name:
+# array w/ one row per outer value and one column per inner value, in the order they were given
+# reversed lines are put back in order, lines not measured (yet) are NaN
+def loadMap(path):
+    store = ColumnReader(path)
+    outerValues = numpy.asarray(store.settings['outerValues'])
+    innerValues = numpy.asarray(store.settings['innerValues'])
+    grid = dict((name, numpy.full((len(outerValues), len(innerValues)), numpy.nan)) for name in COLUMNS)
+    for i, sweep in enumerate(store.sweeps):
+        line = sweep['settings']['line']
+        data = store.sweep(i)
+        for name in COLUMNS:
+            grid[name][line] = data[name][::-1] if sweep['settings']['reversed'] else data[name]
+    return outerValues, innerValues, grid
@@ -0,0 +1,215 @@
+# monitoring a device for days w/o memory growing, i.e.
+# >>> log = MonitorLog('C:/Data/cooldown')
+# >>> monitor(k, log, interval=0.5)  # until ctrl-c, or pass duration in seconds
+# >>> log.recent(100)  # the last 100 readings
+# >>> log.query(start, stop, '1 min')  # min, max and mean per minute, from the whole run
+#
+# the last ringSize readings are kept in memory, everything else goes to column stores (see columnStore.py)
+# in the log's directory in chunks of chunkSize: every reading in raw.cols, and the min, max and mean of
+# each 1 s, 1 min and 1 h in 1s.cols, 1min.cols and 1h.cols. Queries read the stores memory-mapped, so
+# looking at a day of 1 min averages doesn't load a day of readings.
+# times are the computer's (seconds since the epoch), so a log can be reopened and added to later
+
+from __future__ import print_function
+
+import os
+import time
+
+import numpy
+
+from columnStore import ColumnReader, ColumnWriter, STORE_EXTENSION, storeExists
+from dataBuffer import COLUMNS
+from keithley import _clock
+
+DEFAULT_QUANTITIES = ('volts', 'amps')
+DEFAULT_RING_SIZE = 10000  # readings kept in memory
+DEFAULT_CHUNK_SIZE = 1000  # readings or bins written to disk at once
+DEFAULT_INTERVAL = 1  # seconds between readings
+# name and length in seconds of each downsampled tier
+TIERS = (('1 s', 1), ('1 min', 60), ('1 h', 3600))
+RAW = 'raw'
+
+
+def _storeName(tier):
+    return tier.replace(' ', '') + STORE_EXTENSION
+
+
+# query rows of a store whose time column is between start and stop
+def _readStore(path, start, stop):
+    if not storeExists(path):
+        return None
+    store = ColumnReader(path)
+    times = store['time']
+    first = 0 if start is None else numpy.searchsorted(times, start, side='left')
+    last = len(times) if stop is None else numpy.searchsorted(times, stop, side='right')
+    return numpy.column_stack([store[name][first:last] for name in store.columns])
+
+
+class _Tier(object):
+    """min, max and mean of each quantity over bins of a fixed length"""
+
+    def __init__(self, path, seconds, quantities, chunkSize):
+        self.seconds = seconds
+        self.columns = ['time', 'count'] + [name + suffix for name in quantities
+                                            for suffix in ('_min', '_max', '_mean')]
+        self.writer = ColumnWriter(path, self.columns)
+        self.pending = numpy.empty((chunkSize, len(self.columns)))
+        self.numPending = 0
+        self.bin = None  # start time of the bin being filled
+        self.count = 0
+        self.minimum = self.maximum = self.total = None
+
+    # add readings (times sorted), values has one row per reading and one column per quantity
+    def add(self, times, values):
+        bins = numpy.floor(times / self.seconds) * self.seconds
+        starts = numpy.concatenate(([0], numpy.nonzero(numpy.diff(bins))[0] + 1))
+        counts = numpy.diff(numpy.concatenate((starts, [len(times)])))
+        minima = numpy.fmin.reduceat(values, starts, axis=0)
+        maxima = numpy.fmax.reduceat(values, starts, axis=0)
+        totals = numpy.add.reduceat(values, starts, axis=0)
+        for i, start in enumerate(starts):
+            if bins[start] != self.bin:
+                self.closeBin()
+                self.bin, self.count = bins[start], 0
+                self.minimum, self.maximum, self.total = minima[i], maxima[i], totals[i]
+            else:
+                self.minimum = numpy.fmin(self.minimum, minima[i])
+                self.maximum = numpy.fmax(self.maximum, maxima[i])
+                self.total = self.total + totals[i]
+            self.count += counts[i]
+
+    # the bin being filled as a row of self.columns, None if there isn't one
+    def currentRow(self):
+        if self.bin is None:
+            return None
+        summary = numpy.column_stack((self.minimum, self.maximum, self.total / self.count)).ravel()
+        return numpy.concatenate(([self.bin, self.count], summary))
+
+    # move the bin being filled to the pending bins
+    def closeBin(self):
+        row = self.currentRow()
+        if row is None:
+            return
+        if self.numPending == len(self.pending):
+            self.flush()
+        self.pending[self.numPending] = row
+        self.numPending += 1
+        self.bin = None
+
+    def flush(self):
+        if self.numPending:
+            self.writer.extend(self.pending[:self.numPending].T)
+            self.numPending = 0
+
+
+class MonitorLog(object):
+    """Readings over a long time in bounded memory, w/ 1 s, 1 min and 1 h min/max/mean on disk"""
+
+    # path is a directory, created if needed; an existing log is added to
+    def __init__(self, path, quantities=DEFAULT_QUANTITIES, ringSize=DEFAULT_RING_SIZE, chunkSize=DEFAULT_CHUNK_SIZE):
+        self.path = path
+        self.quantities = list(quantities)
+        self.columns = ['time'] + self.quantities
+        self.raw = ColumnWriter(os.path.join(path, _storeName(RAW)), self.columns)
+        self.tiers = dict((name, _Tier(os.path.join(path, _storeName(name)), seconds, self.quantities, chunkSize))
+                          for name, seconds in TIERS)
+        # the ring buffer of recent readings, also the readings not written to raw.cols yet
+        self.ring = numpy.empty((max(ringSize, chunkSize), len(self.columns)))
+        self.numReadings = 0  # added since the log was opened
+        self.numWritten = 0  # of those, written to raw.cols
+        self.chunkSize = chunkSize
+
+    # add readings taken at times (a number or a sorted sequence), w/ one value or sequence per quantity
+    def add(self, times, *values):
+        times = numpy.atleast_1d(numpy.asarray(times, dtype=float))
+        values = numpy.column_stack([numpy.atleast_1d(numpy.asarray(value, dtype=float)) for value in values])
+        for first in range(0, len(times), self.chunkSize):
+            self._add(times[first:first + self.chunkSize], values[first:first + self.chunkSize])
+
+    def _add(self, times, values):
+        if self.numReadings + len(times) - self.numWritten > len(self.ring):
+            self._flushRaw()
+        positions = (self.numReadings + numpy.arange(len(times))) % len(self.ring)
+        self.ring[positions, 0] = times
+        self.ring[positions, 1:] = values
+        self.numReadings += len(times)
+        if self.numReadings - self.numWritten >= self.chunkSize:
+            self._flushRaw()
+        for tier in self.tiers.values():
+            tier.add(times, values)
+
+    # the readings from number first (counted from when the log was opened) on, that are still in the ring
+    def _ringRows(self, first):
+        first = max(first, self.numReadings - len(self.ring))
+        positions = numpy.arange(first, self.numReadings) % len(self.ring)
+        return self.ring[positions]
+
+    def _flushRaw(self):
+        rows = self._ringRows(self.numWritten)
+        if len(rows):
+            self.raw.extend(rows.T)
+        self.numWritten = self.numReadings
+
+    # the last numReadings readings (all those in memory by default) as a dict of column name: array
+    def recent(self, numReadings=None):
+        first = 0 if numReadings is None else self.numReadings - numReadings
+        return dict(zip(self.columns, self._ringRows(first).T))
+
+    # readings (tier 'raw') or bins (tier '1 s', '1 min', '1 h') between start and stop, as a dict of
+    # column name: array; bins have columns time (the start of the bin), count and <quantity>_min/_max/_mean
+    # includes what hasn't been written to disk yet, and the bin still being filled
+    def query(self, start=None, stop=None, tier='1 min'):
+        if tier == RAW:
+            columns = self.columns
+            stored = _readStore(os.path.join(self.path, _storeName(RAW)), start, stop)
+            memory = self._ringRows(self.numWritten)
+        else:
+            levels = self.tiers[tier]
+            columns = levels.columns
+            stored = _readStore(os.path.join(self.path, _storeName(tier)), start, stop)
+            memory = levels.pending[:levels.numPending]
+            current = levels.currentRow()
+            if current is not None:
+                memory = numpy.vstack((memory, current))
+        if len(memory):
+            inRange = numpy.ones(len(memory), dtype=bool)
+            if start is not None:
+                inRange &= memory[:, 0] >= start
+            if stop is not None:
+                inRange &= memory[:, 0] <= stop
+            memory = memory[inRange]
+        rows = memory if stored is None else numpy.vstack((stored, memory))
+        return dict(zip(columns, rows.reshape(-1, len(columns)).T))
+
+    # write the readings and finished bins in memory to disk, the bins being filled stay open
+    def flush(self):
+        self._flushRaw()
+        for tier in self.tiers.values():
+            tier.flush()
+
+    # write everything, including the bins being filled
+    def close(self):
+        for tier in self.tiers.values():
+            tier.closeBin()
+        self.flush()
+
+
+# read keithley every interval seconds and add the readings to log, for duration seconds or until ctrl-c
+# uses Keithley2400.readPoint, so nothing piles up in keithley.buffer however long it runs
+# returns the number of readings taken
+def monitor(keithley, log, interval=DEFAULT_INTERVAL, duration=None):
+    columns = [COLUMNS.index(name) for name in log.quantities]
+    numReadings = 0
+    startTime = deadline = _clock()
+    try:
+        while duration is None or _clock() - startTime < duration:
+            reading = keithley.readPoint()[-1]
+            log.add(time.time(), *reading[columns])
+            numReadings += 1
+            deadline = max(deadline + interval, _clock())
+            time.sleep(max(0, deadline - _clock()))
+    except KeyboardInterrupt:
+        print("monitoring stopped after " + str(numReadings) + " readings")
+    finally:
+        log.flush()
+    return numReadings
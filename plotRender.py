@@ -0,0 +1,88 @@
+# plot rendering for large sweeps: envelope decimation plus PNG rendering in a pool of worker processes, i.e.
+# >>> job = renderLater('C:/Data/gateSweep_0001.png', [(Vgate, Isd, 'bs'), (Vgate, Igate, 'ro')],
+# ...                   xlabel='Gate voltage (V)', ylabel='Current (A)')
+# >>> job.get()  # waits for the PNG to be written, returns its file name
+#
+# each series is decimated to at most 2 * numBins points before it is sent to a worker, keeping the min and
+# max of each bin, so a plot takes about as long to render for a million points as for a thousand and still
+# shows every spike
+
+import multiprocessing
+import threading
+
+import numpy
+
+from backgroundWriter import atShutdown
+
+DEFAULT_NUM_BINS = 1000  # about the width of a saved plot in pixels
+DEFAULT_RENDER_PROCESSES = 2
+
+_pool = None
+_poolLock = threading.Lock()
+
+
+# reduce (x, y) to the min and max y of each of numBins runs of consecutive points, in the original order
+# binning by point number rather than by x keeps the up and down legs of a sweep apart
+def decimate(x, y, numBins=DEFAULT_NUM_BINS):
+    x = numpy.asarray(x)
+    y = numpy.asarray(y, dtype=float)
+    numPts = len(y)
+    if numPts <= 2 * numBins:
+        return x, y
+
+    binSize = -(-numPts // numBins)  # ceil
+    numRows = -(-numPts // binSize)
+    padded = numpy.full(numRows * binSize, numpy.nan)
+    padded[:numPts] = y
+    padded = padded.reshape(numRows, binSize)
+    # the padding (and any NaN readings) can't be a bin's min or max
+    lows = numpy.where(numpy.isnan(padded), numpy.inf, padded).argmin(axis=1)
+    highs = numpy.where(numpy.isnan(padded), -numpy.inf, padded).argmax(axis=1)
+
+    offsets = numpy.arange(numRows) * binSize
+    index = numpy.sort(numpy.column_stack((lows, highs)), axis=1) + offsets[:, None]
+    index = index.ravel()
+    return x[index], y[index]
+
+
+# draw the series onto a PNG with the Agg backend, runs in a worker process
+# series is a list of (x, y, style), labels are any of title, xlabel, ylabel, xlim
+def renderPNG(fileName, series, title=None, xlabel=None, ylabel=None, xlim=None):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(111)
+    for x, y, style in series:
+        axes.plot(x, y, style)
+    if title is not None: axes.set_title(title)
+    if xlabel is not None: axes.set_xlabel(xlabel)
+    if ylabel is not None: axes.set_ylabel(ylabel)
+    if xlim is not None: axes.set_xlim(xlim)
+    figure.savefig(fileName, bbox_inches='tight')
+    return fileName
+
+
+def _closePool():
+    if _pool is not None:
+        _pool.close()
+        _pool.join()  # finish the plots already queued
+
+
+# the render processes, started the first time they are needed
+def renderPool():
+    global _pool
+    with _poolLock:
+        if _pool is None:
+            _pool = multiprocessing.Pool(DEFAULT_RENDER_PROCESSES)
+            # after the background writer, whose savePlot jobs wait on the pool
+            atShutdown(_closePool)
+        return _pool
+
+
+# decimate the series and render them to fileName in a worker process
+# returns a multiprocessing AsyncResult, .get() waits for the file and returns its name
+def renderLater(fileName, series, numBins=DEFAULT_NUM_BINS, **labels):
+    series = [decimate(x, y, numBins) + (style,) for x, y, style in series]
+    return renderPool().apply_async(renderPNG, (fileName, series), labels)
@@ -0,0 +1,129 @@
+# an SQLite index of the runs saved in a data directory, kept next to the data as runCatalog.sqlite
+# hands out the next file number for a name without probing the directory for name0001.txt, name0002.txt, ...
+# and records each run's parameters, instrument addresses and timings so runs can be found w/o opening them, i.e.
+# >>> catalog = openCatalog('C:/Data/')
+# >>> path, number = catalog.nextPath('gateSweep_', '.txt')
+# >>> catalog.record(path, params={'VgateStep': 0.2, 'sdBias': 5E-3}, instruments={'gate': 24})
+# >>> catalog.find(VgateStep=0.2, sdBias=(1E-3, 1E-2))  # a (low, high) tuple matches a range
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+CATALOG_FILE = 'runCatalog.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (name TEXT, extension TEXT, last INTEGER, PRIMARY KEY (name, extension));
+CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, path TEXT, name TEXT, extension TEXT, number INTEGER,
+                                 saved REAL, params TEXT, instruments TEXT, timings TEXT);
+CREATE TABLE IF NOT EXISTS params (run INTEGER, key TEXT, value REAL, text TEXT);
+CREATE INDEX IF NOT EXISTS paramsByValue ON params (key, value);
+CREATE INDEX IF NOT EXISTS paramsByText ON params (key, text);
+CREATE INDEX IF NOT EXISTS runsByPath ON runs (path);
+"""
+
+_catalogs = {}
+_catalogsLock = threading.Lock()
+
+
+# the catalog for the data directory filePath, opened once per process
+def openCatalog(filePath):
+    key = os.path.abspath(filePath)
+    with _catalogsLock:
+        if key not in _catalogs:
+            _catalogs[key] = RunCatalog(filePath)
+        return _catalogs[key]
+
+
+def _isNumber(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class RunCatalog(object):
+    """The runs saved in one data directory, with their parameters"""
+
+    def __init__(self, filePath):
+        self.filePath = filePath
+        self.lock = threading.Lock()
+        # transactions are begun and committed explicitly, see nextPath and record
+        self.db = sqlite3.connect(os.path.join(filePath, CATALOG_FILE), timeout=30, check_same_thread=False,
+                                  isolation_level=None)
+        self.db.executescript(SCHEMA)
+
+    # highest number already used for name####extension in the directory, only looked up the first time
+    # a name is seen so that runs saved before there was a catalog aren't overwritten
+    def _scanDirectory(self, name, extension):
+        pattern = re.compile(re.escape(name) + r'(\d{4,})' + re.escape(extension) + '$')
+        numbers = [int(match.group(1)) for match in map(pattern.match, os.listdir(self.filePath or '.')) if match]
+        return max(numbers) if numbers else 0
+
+    def _path(self, name, extension, number):
+        return self.filePath + name + "{:04d}".format(number) + extension
+
+    # reserve the next file for a name, returns (path, number), i.e. ('C:/Data/gateSweep_0003.txt', 3)
+    # numbers whose file is already there, e.g. saved by a copy of the code w/o the catalog, are skipped
+    def nextPath(self, name, extension):
+        with self.lock:
+            # BEGIN IMMEDIATE so that two processes saving to the same directory can't get the same number
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute("SELECT last FROM counters WHERE name = ? AND extension = ?",
+                                      (name, extension)).fetchone()
+                number = (row[0] if row else self._scanDirectory(name, extension)) + 1
+                while os.path.exists(self._path(name, extension, number)):
+                    number += 1
+                self.db.execute("INSERT OR REPLACE INTO counters VALUES (?, ?, ?)", (name, extension, number))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return self._path(name, extension, number), number
+
+    # record a saved run, params and instruments are dicts of simple values, timings a dict of seconds
+    # returns the run's id in the catalog
+    def record(self, path, params=None, instruments=None, timings=None):
+        params = params or {}
+        fileName = os.path.basename(path)
+        match = re.match(r'(.*?)(\d{4,})(\.\w+)$', fileName)
+        name, number, extension = (match.group(1), int(match.group(2)), match.group(3)) if match \
+            else (fileName, None, '')
+        with self.lock:
+            self.db.execute("BEGIN")
+            cursor = self.db.execute("INSERT INTO runs (path, name, extension, number, saved, params, instruments, "
+                                     "timings) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                     (path, name, extension, number, time.time(), json.dumps(params),
+                                      json.dumps(instruments or {}), json.dumps(timings or {})))
+            runId = cursor.lastrowid
+            self.db.executemany("INSERT INTO params VALUES (?, ?, ?, ?)",
+                                [(runId, key, value if _isNumber(value) else None,
+                                  None if _isNumber(value) else str(value)) for key, value in params.items()])
+            self.db.execute("COMMIT")
+        return runId
+
+    # runs whose params match all of the given ones, oldest first
+    # a value matches exactly, a (low, high) tuple matches low <= value <= high
+    def find(self, **params):
+        clauses, args = [], []
+        for key, value in sorted(params.items()):
+            if isinstance(value, tuple):
+                clauses.append("id IN (SELECT run FROM params WHERE key = ? AND value BETWEEN ? AND ?)")
+                args += [key, value[0], value[1]]
+            elif _isNumber(value):
+                clauses.append("id IN (SELECT run FROM params WHERE key = ? AND value = ?)")
+                args += [key, value]
+            else:
+                clauses.append("id IN (SELECT run FROM params WHERE key = ? AND text = ?)")
+                args += [key, str(value)]
+        query = "SELECT id, path, number, saved, params, instruments, timings FROM runs"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        with self.lock:
+            rows = self.db.execute(query + " ORDER BY id", args).fetchall()
+        return [{'id': row[0], 'path': row[1], 'number': row[2], 'saved': row[3], 'params': json.loads(row[4]),
+                 'instruments': json.loads(row[5]), 'timings': json.loads(row[6])} for row in rows]
+
+    def close(self):
+        self.db.close()
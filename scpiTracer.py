@@ -0,0 +1,168 @@
+# records every bus transaction a Keithley2400 makes, to find out where the time in a sweep goes, i.e.
+# >>> tracer = ScpiTracer()
+# >>> k.setTracer(tracer)
+# >>> with tracer.sweep('IV 1'):
+# ...     k.doMeasurement()
+# >>> tracer.printSummary()
+# >>> tracer.saveJSON('trace.json')
+# >>> k.setTracer(None)
+#
+# the tracer sits between the Keithley2400 and its transport, so there is no cost at all when it is off.
+# each record has the command, bytes sent or received, seconds taken and the Keithley2400 methods it
+# was made from, e.g. operation 'doMeasurement' with path 'doMeasurement/_pullData/_readTrace'
+
+from __future__ import print_function
+
+import json
+import sys
+import threading
+from contextlib import contextmanager
+
+import numpy
+
+from keithley import _clock
+
+# the Keithley2400 methods that only pass commands on, left out of a record's path
+BUS_METHODS = ('write', 'ask', 'ask_for_values', 'read', 'read_raw', 'read_values', 'trigger', 'wait_for_srq',
+               'flush', 'batch')
+# latency histogram bin edges in seconds, 10 us to 100 s
+HISTOGRAM_BINS = numpy.logspace(-5, 2, 15)
+ASCII_VALUE_BYTES = 14  # e.g. '+1.234567E-03,', for reads that come back already parsed
+ROW_FORMAT = "{:<36}{:>8}{:>12}{:>12.4f}{:>12.3f}"
+HEADER_FORMAT = "{:<36}{:>8}{:>12}{:>12}{:>12}"
+
+
+class ScpiTracer(object):
+    """Bus transactions of one or more Keithley2400s, with what they were for and how long they took"""
+
+    def __init__(self):
+        self.records = []  # (kind, command, bytes, start, seconds, operation, path, sweep)
+        self.sweepName = None
+        self.lock = threading.Lock()
+
+    # records made inside the with block are labelled name in the per-sweep breakdown
+    @contextmanager
+    def sweep(self, name):
+        previous, self.sweepName = self.sweepName, name
+        try:
+            yield self
+        finally:
+            self.sweepName = previous
+
+    # the Keithley2400 methods on the stack that led to this transaction, outermost first
+    def _operation(self, keithley):
+        names = []
+        frame = sys._getframe(2)
+        while frame is not None:
+            if frame.f_locals.get('self') is keithley and frame.f_code.co_name not in BUS_METHODS:
+                names.append(frame.f_code.co_name)
+            frame = frame.f_back
+        names.reverse()
+        return (names[0] if names else '', '/'.join(names))
+
+    def record(self, keithley, kind, command, numBytes, start, seconds):
+        operation, path = self._operation(keithley)
+        with self.lock:
+            self.records.append((kind, command, numBytes, start, seconds, operation, path, self.sweepName))
+
+    def clear(self):
+        with self.lock:
+            self.records = []
+
+    # count, bytes and seconds per key, key is one of 'kind', 'command', 'operation', 'path', 'sweep'
+    def summary(self, key='operation', records=None):
+        index = ('kind', 'command', 'bytes', 'start', 'seconds', 'operation', 'path', 'sweep').index(key)
+        totals = {}
+        for record in (self.records if records is None else records):
+            total = totals.setdefault(str(record[index]), {'count': 0, 'bytes': 0, 'seconds': 0.0})
+            total['count'] += 1
+            total['bytes'] += record[2]
+            total['seconds'] += record[4]
+        return totals
+
+    # how many transactions of each kind took how long, counts per bin of HISTOGRAM_BINS
+    def histograms(self):
+        kinds = sorted(set(record[0] for record in self.records))
+        return dict((kind, numpy.histogram([record[4] for record in self.records if record[0] == kind],
+                                           HISTOGRAM_BINS)[0].tolist()) for kind in kinds)
+
+    # the summary by operation for each sweep, records made outside tracer.sweep() are under 'None'
+    def sweepBreakdown(self):
+        sweeps = {}
+        for record in self.records:
+            sweeps.setdefault(str(record[7]), []).append(record)
+        return dict((name, self.summary('operation', records)) for name, records in sweeps.items())
+
+    def toDict(self, includeRecords=False):
+        result = {'summary': self.summary('operation'),
+                  'byKind': self.summary('kind'),
+                  'histogramBins': HISTOGRAM_BINS.tolist(),
+                  'histograms': self.histograms(),
+                  'sweeps': self.sweepBreakdown()}
+        if includeRecords:
+            names = ('kind', 'command', 'bytes', 'start', 'seconds', 'operation', 'path', 'sweep')
+            result['records'] = [dict(zip(names, record)) for record in self.records]
+        return result
+
+    def saveJSON(self, fileName, includeRecords=False):
+        with open(fileName, 'w') as saveFile:
+            json.dump(self.toDict(includeRecords), saveFile, indent=1)
+        return fileName
+
+    # the operations that spent the most time on the bus, worst first
+    def printSummary(self, key='operation'):
+        print(HEADER_FORMAT.format(key, "count", "bytes", "seconds", "ms each"))
+        totals = self.summary(key)
+        for name in sorted(totals, key=lambda name: -totals[name]['seconds']):
+            total = totals[name]
+            print(ROW_FORMAT.format(name[:35], total['count'], total['bytes'], total['seconds'],
+                                    1E3 * total['seconds'] / total['count']))
+        print("")
+
+
+class TracingTransport(object):
+    """Wraps a Keithley2400's transport, recording each call with a ScpiTracer, see Keithley2400.setTracer"""
+
+    def __init__(self, transport, tracer, keithley):
+        self.transport = transport
+        self.tracer = tracer
+        self.keithley = keithley
+        self.lastCommand = ''
+
+    def __getattr__(self, name):
+        if name == 'transport':
+            raise AttributeError(name)
+        return getattr(self.transport, name)
+
+    def _call(self, kind, command, function, *args):
+        start = _clock()
+        result = function(*args)
+        seconds = _clock() - start
+        if kind == 'write':
+            numBytes = len(command)
+        elif isinstance(result, (bytes, str)):
+            numBytes = len(result)
+        else:
+            numBytes = 0 if result is None else len(result) * ASCII_VALUE_BYTES
+        self.tracer.record(self.keithley, kind, command, numBytes, start, seconds)
+        return result
+
+    def write(self, message):
+        self.lastCommand = message
+        return self._call('write', message, self.transport.write, message)
+
+    # reads are recorded against the query that asked for them
+    def read(self):
+        return self._call('read', self.lastCommand, self.transport.read)
+
+    def read_raw(self):
+        return self._call('read', self.lastCommand, self.transport.read_raw)
+
+    def read_values(self, format=None):
+        return self._call('read', self.lastCommand, self.transport.read_values, format)
+
+    def trigger(self):
+        return self._call('trigger', '*TRG', self.transport.trigger)
+
+    def wait_for_srq(self, timeout=25):
+        return self._call('wait_for_srq', 'SRQ', self.transport.wait_for_srq, timeout)
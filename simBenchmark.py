@@ -0,0 +1,79 @@
+# example script timing the measurement flows against simulated Keithleys (see simKeithley.py)
+# needs numpy and matplotlib but no GPIB card, VISA driver or pyvisa, i.e.
+# $ python simBenchmark.py
+
+import tempfile
+import time
+import matplotlib
+matplotlib.use('Agg')  # don't need a display to save plots
+
+from keithley import Keithley2400
+from simKeithley import SimulatedKeithley2400, SimulatedBus
+from ivSweep import ivSweep
+from gateSweep import gateSweep
+from instrumentPool import InstrumentPool, measureSweep
+from scpiTracer import ScpiTracer
+
+LATENCY = 2E-3  # seconds per bus transaction
+INTEGRATION_TIME = 1E-3  # seconds per reading
+ROW_FORMAT = "{:<36}{:>10.3f} s{:>8d} transactions"
+
+
+# run function(), then print how long it took and how many bus transactions it needed
+def timeIt(name, function, transports):
+    transactionsBefore = sum(t.transactions for t in transports)
+    startTime = time.time()
+    function()
+    print(ROW_FORMAT.format(name, time.time() - startTime,
+                            sum(t.transactions for t in transports) - transactionsBefore))
+
+
+if __name__ == "__main__":
+    savePath = tempfile.mkdtemp() + '/'
+
+    # a single 501 point IV sweep, ascii then binary transfer
+    transport = SimulatedKeithley2400(latency=LATENCY, integrationTime=INTEGRATION_TIME)
+    k = Keithley2400(23, transport=transport)
+    k.setMeasure('current')
+    k.setSourceSweep('voltage', -5E-3, 5E-3, 2E-5)
+    timeIt('Keithley2400.doMeasurement (ascii)', k.doMeasurement, [transport])
+    k.setDataFormat('real32')
+    timeIt('Keithley2400.doMeasurement (real32)', k.doMeasurement, [transport])
+
+    # where the time in one measurement goes
+    tracer = ScpiTracer()
+    k.setTracer(tracer)
+    k.doMeasurement()
+    k.setTracer(None)
+    tracer.printSummary('path')
+
+    # a 1 V ramp in 50 mV steps, 10 ms apart
+    timeIt('Keithley2400.rampOutputOn', lambda: k.rampOutputOn(1, 50E-3, 10E-3), [transport])
+    print("achieved {rate:.2f} V/s of {targetRate:.2f} V/s".format(**k.rampStats))
+
+    # the example flows, with the gate Keithley on GPIB 24 and the source-drain Keithley on GPIB 23
+    bus = SimulatedBus(latency=LATENCY, integrationTime=INTEGRATION_TIME)
+
+    iv = ivSweep(bus.open, 'n')
+    timeIt('ivSweep.doSweep', iv.doSweep, [bus.open(23)])
+
+    gs = gateSweep(bus.open, 'n')
+    gs.savePath = savePath
+    timeIt('gateSweep.doTLINKSweep', gs.doTLINKSweep, bus.instruments.values())
+    timeIt('gateSweep.doListSweep', gs.doListSweep, bus.instruments.values())
+    timeIt('gateSweep.doSweep', gs.doSweep, bus.instruments.values())
+
+    # the TLINK sweep again w/ the 'fast' speed profile on both Keithleys (0.01 NPLC)
+    gs.speedProfile = 'fast'
+    gs._configureMeasurement()
+    timeIt('gateSweep.doTLINKSweep (fast)', gs.doTLINKSweep, bus.instruments.values())
+
+    # the same sweep on 8 Keithleys spread over two boards, one at a time then all at once
+    pool = InstrumentPool([23, 25, 26, 27, (1, 23), (1, 25), (1, 26), (1, 27)],
+                          SimulatedBus(latency=LATENCY, integrationTime=INTEGRATION_TIME).open)
+    pool.run(lambda keithley: keithley.setMeasure('current'))
+    transports = [keithley.transport for keithley in pool.keithleys.values()]
+    timeIt('8 sweeps, one after another',
+           lambda: [measureSweep(keithley, 'voltage', -5E-3, 5E-3, 5E-5) for keithley in pool.keithleys.values()],
+           transports)
+    timeIt('InstrumentPool.sweep, 8 at once', lambda: pool.sweep('voltage', -5E-3, 5E-3, 5E-5), transports)
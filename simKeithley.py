@@ -0,0 +1,525 @@
+# a simulated Keithley 2400 that can stand in for visa.GpibInstrument, so that measurement scripts
+# can be run and timed without a GPIB card or a sourcemeter, e.g.
+# >>> from keithley import Keithley2400
+# >>> from simKeithley import SimulatedKeithley2400
+# >>> k = Keithley2400(23, transport=SimulatedKeithley2400(latency=0, integrationTime=0))
+#
+# or, for the two Keithley gate sweep (gate on GPIB 24, source-drain on GPIB 23)
+# >>> from gateSweep import gateSweep
+# >>> from simKeithley import SimulatedBus
+# >>> gs = gateSweep(SimulatedBus().open, 'n')
+#
+# only the SCPI subset used by keithley.py is understood, anything else is stored and echoed back
+# by the matching query. Time passes in real time: every bus transaction costs `latency` seconds
+# and every reading costs `integrationTime` seconds per NPLC plus the trigger and source delays.
+
+import bisect
+import math
+import re
+import time
+import numpy
+
+DEFAULT_LATENCY = 2E-3  # seconds per bus transaction
+DEFAULT_INTEGRATION_TIME = 1 / 60.  # seconds per reading at 1 NPLC, 60 Hz
+DEFAULT_GATE_ADDRESS = 24  # GPIB address that SimulatedBus wires to the gate
+
+# the device under test, loosely a graphene field effect transistor
+DEFAULT_CONTACT_RESISTANCE = 1E3  # ohms
+DEFAULT_PEAK_RESISTANCE = 4E3  # ohms, added at the charge neutrality point
+DEFAULT_DIRAC_POINT = 1.5  # volts
+DEFAULT_PEAK_WIDTH = 2.0  # volts
+DEFAULT_GATE_LEAKAGE = 1E-12  # gate leakage conductance in siemens
+DEFAULT_NOISE = 1E-3  # relative noise on each reading
+
+NOT_A_NUMBER = 9.91E37  # what the 2400 reports for a quantity it didn't measure
+BUFFER_FULL = 512  # measurement event register bit set when the trace buffer fills
+
+# settings after *RST, keyed by the short form of the SCPI header
+RESET_SETTINGS = {
+    'SOUR:FUNC:MODE': 'VOLT',
+    'SOUR:VOLT:MODE': 'FIX', 'SOUR:VOLT:LEV': '0', 'SOUR:VOLT:RANG': '21',
+    'SOUR:VOLT:STAR': '0', 'SOUR:VOLT:STOP': '0', 'SOUR:VOLT:STEP': '0',
+    'SOUR:CURR:MODE': 'FIX', 'SOUR:CURR:LEV': '0', 'SOUR:CURR:RANG': '1E-4',
+    'SOUR:CURR:STAR': '0', 'SOUR:CURR:STOP': '0', 'SOUR:CURR:STEP': '0',
+    'SOUR:DEL': '0',
+    'SENS:CURR:PROT': '1.05E-4', 'SENS:VOLT:PROT': '21',
+    'SENS:CURR:NPLC': '1', 'SENS:VOLT:NPLC': '1', 'SENS:RES:NPLC': '1',
+    'SENS:AVER:STAT': '0', 'SENS:AVER:TCON': 'REP', 'SENS:AVER:COUN': '10',
+    'CALC3:FORM': 'MEAN',
+    'OUTP': '0',
+    'ARM:COUN': '1', 'ARM:SOUR': 'IMM',
+    'TRIG:COUN': '1', 'TRIG:DEL': '0', 'TRIG:SOUR': 'IMM', 'TRIG:INP': 'SOUR', 'TRIG:OUTP': 'NONE',
+    'TRAC:POIN': '100', 'TRAC:FEED': 'SENS', 'TRAC:FEED:CONT': 'NEV',
+    'FORM:DATA': 'ASC', 'FORM:BORD': 'SWAP',
+}
+
+# sense function names as the 2400 reports them, in the order it reports them
+SENSE_FUNCTIONS = ('VOLT:DC', 'CURR:DC', 'RES')
+
+
+# SCPI short form of a header node, e.g. VOLTAGE -> VOLT, LEVEL -> LEV, CALCULATE3 -> CALC3
+# numeric suffix 1 is the default and is dropped, e.g. SENSE1 -> SENS
+def shortForm(node):
+    match = re.match(r'([A-Z*]*)(\d*)$', node.upper())
+    if match is None:
+        return node.upper()
+    word, suffix = match.groups()
+    if len(word) > 4:
+        word = word[:3] if word[3] in 'AEIOU' else word[:4]
+    return word + ('' if suffix == '1' else suffix)
+
+
+# split a message into commands at ';', ignoring ';' inside quotes
+def splitCommands(message):
+    return [c.strip() for c in re.findall(r"(?:[^;'\"]|'[^']*'|\"[^\"]*\")+", message) if c.strip()]
+
+
+class SimulatedTimeout(Exception):
+    pass
+
+
+class SimulatedDevice(object):
+    """A gated two terminal device shared by the simulated Keithleys wired to it.
+
+    The source-drain resistance peaks at the charge neutrality (Dirac) point, so IV curves are
+    linear and gate sweeps show a peak. The gate voltage is whatever the gate Keithley was
+    sourcing at the moment a reading is taken.
+    """
+
+    def __init__(self, contactResistance=DEFAULT_CONTACT_RESISTANCE, peakResistance=DEFAULT_PEAK_RESISTANCE,
+                 diracPoint=DEFAULT_DIRAC_POINT, peakWidth=DEFAULT_PEAK_WIDTH, gateLeakage=DEFAULT_GATE_LEAKAGE,
+                 noise=DEFAULT_NOISE, seed=None):
+        self.contactResistance = contactResistance
+        self.peakResistance = peakResistance
+        self.diracPoint = diracPoint
+        self.peakWidth = peakWidth
+        self.gateLeakage = gateLeakage
+        self.noise = noise
+        self.random = numpy.random.RandomState(seed)
+        # piecewise constant gate voltage: gateValues[i] from gateTimes[i] until gateTimes[i + 1]
+        self.gateTimes = [-float('inf')]
+        self.gateValues = [0.0]
+
+    # record that the gate is at each of values from the matching time onwards
+    def setGate(self, times, values):
+        for t, value in zip(times, values):
+            i = bisect.bisect_right(self.gateTimes, t)
+            self.gateTimes.insert(i, t)
+            self.gateValues.insert(i, value)
+
+    def gateVoltage(self, times):
+        indices = numpy.searchsorted(self.gateTimes, times, side='right') - 1
+        return numpy.asarray(self.gateValues)[indices]
+
+    def resistance(self, gateVoltage):
+        return self.contactResistance + self.peakResistance / numpy.sqrt(
+            1 + ((gateVoltage - self.diracPoint) / self.peakWidth) ** 2)
+
+    # multiply values by (1 + noise), noise drawn fresh for each value
+    # each value can be the average of numAveraged readings, which has less noise
+    def addNoise(self, values, numAveraged=1):
+        return values * (1 + self.noise / math.sqrt(numAveraged) * self.random.standard_normal(len(values)))
+
+
+class SimulatedKeithley2400(object):
+    """A software Keithley 2400 with the visa.GpibInstrument methods Keithley2400 uses.
+
+    terminal is 'sd' for a Keithley across the device or 'gate' for one driving its gate.
+    """
+
+    def __init__(self, device=None, terminal='sd', latency=DEFAULT_LATENCY,
+                 integrationTime=DEFAULT_INTEGRATION_TIME):
+        self.device = device if device is not None else SimulatedDevice()
+        self.terminal = terminal
+        self.latency = latency
+        self.integrationTime = integrationTime
+        self.timeout = None
+        self.transactions = 0
+        self._reset()
+
+    ############################################
+    # visa.GpibInstrument compatible interface #
+    ############################################
+
+    def write(self, message):
+        self._transaction()
+        path = []
+        for command in splitCommands(message):
+            path = self._execute(command, path)
+
+    def read(self):
+        response = self.read_raw()
+        return response.decode('ascii').strip() if isinstance(response, bytes) else response.strip()
+
+    def read_raw(self):
+        self._transaction()
+        if self._response is None:
+            raise SimulatedTimeout('read with no query pending')
+        response, self._response = self._response, None
+        return response
+
+    def read_values(self, format=None):
+        response = self.read()
+        return [float(value) for value in response.split(',')] if response else []
+
+    def ask(self, message):
+        self.write(message)
+        return self.read()
+
+    def ask_for_values(self, message, format=None):
+        self.write(message)
+        return self.read_values(format)
+
+    # GPIB group execute trigger
+    def trigger(self):
+        self._transaction()
+        self._busTrigger()
+
+    def wait_for_srq(self, timeout=25):
+        self._transaction()
+        self._update()
+        srqTime = self._srqTime()
+        if srqTime is None:
+            raise SimulatedTimeout('waiting for an SRQ that will never come')
+        wait = srqTime - time.time()
+        if timeout is not None and wait > timeout:
+            time.sleep(timeout)
+            raise SimulatedTimeout('SRQ not asserted within %g s' % timeout)
+        if wait > 0:
+            time.sleep(wait)
+        self._update()
+
+    def clear(self):
+        self._transaction()
+        self._response = None
+
+    def close(self):
+        pass
+
+    ####################################
+    # Internal methods: the instrument #
+    ####################################
+
+    def _reset(self):
+        self.settings = dict(RESET_SETTINGS)
+        self.senseFunctions = set(['CURR:DC'])
+        self.sourceList = {'VOLT': [0.0], 'CURR': [0.0]}
+        self.trace = []
+        self.measurementEvents = 0
+        self.measurementEnable = 0
+        self.serviceRequestEnable = 0
+        self.timeOrigin = time.time()
+        self.armed = False
+        self.run = None
+        self._response = None
+
+    # every bus transaction costs the same fixed latency
+    def _transaction(self):
+        self.transactions += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    # run one command, path is the header path of the previous command in the same message
+    # returns the path for the next command
+    def _execute(self, command, path):
+        parts = command.split(None, 1)
+        header, argument = parts[0], (parts[1] if len(parts) > 1 else '')
+        query = header.endswith('?')
+        header = header.rstrip('?')
+        if header.startswith('*'):
+            nodes = [header.upper()]
+            nextPath = path
+        else:
+            relative = not header.startswith(':')
+            nodes = [shortForm(node) for node in header.strip(':').split(':')]
+            if relative:
+                nodes = path + nodes
+            nextPath = nodes[:-1]
+        key = ':'.join(node for node in nodes if node not in ('IMM', 'AMPL', 'EVEN'))
+        if query:
+            self._response = self._query(key, argument)
+        else:
+            self._command(key, argument.strip())
+        return nextPath
+
+    def _command(self, key, argument):
+        self._update()
+        value = argument.upper()
+        if key == '*RST':
+            self._reset()
+        elif key == '*CLS':
+            self.measurementEvents = 0
+        elif key == '*SRE':
+            self.serviceRequestEnable = int(float(argument))
+        elif key == '*TRG':
+            self._busTrigger()
+        elif key == 'STAT:MEAS:ENAB':
+            self.measurementEnable = int(float(argument))
+        elif key == 'SYST:TIME:RES':
+            self.timeOrigin = time.time()
+        elif key == 'INIT':
+            self.armed = True
+            if shortForm(self.settings['ARM:SOUR']) == 'IMM':
+                self._busTrigger()
+        elif key == 'TRAC:CLE':
+            self.trace = []
+        elif key == 'TRAC:FEED:CONT':
+            # storing starts again from the beginning of the buffer
+            self.settings[key] = shortForm(value)
+            if self.settings[key] == 'NEXT':
+                self.trace = []
+        elif key in ('SENS:FUNC', 'SENS:FUNC:ON', 'SENS:FUNC:OFF'):
+            functions = set(self._senseFunction(name) for name in re.findall(r"['\"]([^'\"]*)['\"]", argument))
+            if key == 'SENS:FUNC:OFF':
+                self.senseFunctions -= functions
+            else:
+                self.senseFunctions |= functions
+        elif key in ('SENS:CURR:NPLC', 'SENS:VOLT:NPLC', 'SENS:RES:NPLC'):
+            # one integration time for every function
+            for function in ('CURR', 'VOLT', 'RES'):
+                self.settings['SENS:%s:NPLC' % function] = argument
+        elif key in ('SOUR:FUNC', 'SOUR:FUNC:MODE'):
+            self.settings['SOUR:FUNC:MODE'] = shortForm(value)
+        elif key in ('SOUR:LIST:VOLT', 'SOUR:LIST:CURR'):
+            self.sourceList[key[10:]] = [float(value) for value in argument.split(',')]
+        elif key in ('SOUR:LIST:VOLT:APP', 'SOUR:LIST:CURR:APP'):
+            self.sourceList[key[10:14]].extend(float(value) for value in argument.split(','))
+        elif key in ('SOUR:VOLT', 'SOUR:CURR'):
+            self._setLevel(key[5:], argument)
+        elif key in ('SOUR:VOLT:LEV', 'SOUR:CURR:LEV'):
+            self._setLevel(key[5:9], argument)
+        elif key == 'OUTP':
+            self.settings['OUTP'] = '1' if value in ('ON', '1') else '0'
+            self._driveGate()
+        else:
+            self.settings[key] = shortForm(value) if re.match(r'[A-Z]+$', value) else argument
+
+    def _query(self, key, argument):
+        self._update()
+        if key == '*IDN':
+            return 'KEITHLEY INSTRUMENTS INC.,MODEL 2400,SIMULATED,C30'
+        elif key == '*OPC':
+            return '1'
+        elif key == '*STB':
+            return str(self._statusByte())
+        elif key == 'STAT:MEAS':
+            events, self.measurementEvents = self.measurementEvents, 0
+            return str(events)
+        elif key == 'SENS:FUNC':
+            return ','.join('"%s"' % name for name in SENSE_FUNCTIONS if name in self.senseFunctions)
+        elif key == 'TRAC:POIN:ACT':
+            return str(len(self.trace))
+        elif key == 'TRAC:DATA':
+            return self._traceData()
+        elif key == 'CALC3:DATA':
+            return self._statistic()
+        elif key in ('SOUR:LIST:VOLT', 'SOUR:LIST:CURR'):
+            return ','.join('%+.6E' % value for value in self.sourceList[key[10:]])
+        elif key in ('SOUR:LIST:VOLT:POIN', 'SOUR:LIST:CURR:POIN'):
+            return str(len(self.sourceList[key[10:14]]))
+        elif key in self.settings:
+            return self.settings[key]
+        return '0'
+
+    # e.g. 'CURRENT:DC' -> 'CURR:DC', 'RESISTANCE' -> 'RES'
+    def _senseFunction(self, name):
+        nodes = [shortForm(node) for node in name.split(':')]
+        if nodes[0] in ('VOLT', 'CURR') and len(nodes) == 1:
+            nodes.append('DC')
+        return ':'.join(nodes)
+
+    def _setLevel(self, source, argument):
+        self.settings['SOUR:%s:LEV' % source] = argument
+        self._driveGate()
+
+    # a gate Keithley puts its DC level on the device gate whenever the output is on
+    # during a sweep the level only takes effect once the sweep is over
+    def _driveGate(self):
+        if self.terminal != 'gate':
+            return
+        level = float(self.settings['SOUR:VOLT:LEV']) if self._outputOn() else 0.0
+        self.device.setGate([time.time() if self.run is None else self.run['times'][-1]], [level])
+
+    def _outputOn(self):
+        return self.settings['OUTP'] == '1'
+
+    def _statusByte(self):
+        # bit 0 summarises the measurement event register, bit 6 requests service
+        status = 1 if self.measurementEvents & self.measurementEnable else 0
+        if status & self.serviceRequestEnable:
+            status |= 64
+        return status
+
+    ##################################################
+    # Internal methods: the trigger model and buffer #
+    ##################################################
+
+    # the source value for each reading of a run, from the source mode
+    def _sourceValues(self, numPts):
+        source = self.settings['SOUR:FUNC:MODE']
+        mode = self.settings['SOUR:%s:MODE' % source]
+        if mode == 'SWE':
+            start = float(self.settings['SOUR:%s:STAR' % source])
+            stop = float(self.settings['SOUR:%s:STOP' % source])
+            step = abs(float(self.settings['SOUR:%s:STEP' % source])) or abs(stop - start) or 1
+            sweepPts = int(math.floor(abs(stop - start) / step + 1E-9)) + 1
+            direction = 1 if stop >= start else -1
+            return start + direction * step * (numpy.arange(numPts) % sweepPts)
+        elif mode == 'LIST':
+            values = self.sourceList[source]
+            return numpy.asarray(values, dtype=float)[numpy.arange(numPts) % len(values)]
+        return numpy.ones(numPts) * float(self.settings['SOUR:%s:LEV' % source])
+
+    # start a run of TRIGGER:COUNT readings, if the Keithley has been INIT'ed
+    def _busTrigger(self):
+        if not self.armed:
+            return
+        self.armed = False
+        numPts = int(float(self.settings['TRIG:COUN']))
+        # the repeating filter takes all of its readings again for every reading it stores
+        conversions = self._filterCount() if self.settings['SENS:AVER:TCON'] == 'REP' else 1
+        integrationTime = self.integrationTime * float(self.settings['SENS:CURR:NPLC'])
+        pointTime = (conversions * integrationTime + float(self.settings['TRIG:DEL']) +
+                     float(self.settings['SOUR:DEL']))
+        now = time.time()
+        self.run = {
+            'times': now + pointTime * numpy.arange(1, numPts + 1),
+            'values': self._sourceValues(numPts),
+            'taken': 0,
+        }
+        if self.terminal == 'gate':
+            # the gate steps to each value as its reading starts, and back to the DC level at the end
+            self.device.setGate(self.run['times'] - pointTime, self.run['values'])
+            level = float(self.settings['SOUR:VOLT:LEV']) if self._outputOn() else 0.0
+            self.device.setGate([self.run['times'][-1]], [level])
+
+    # take whatever readings of the current run are finished by now
+    def _update(self):
+        if self.run is None:
+            return
+        run = self.run
+        done = int(numpy.searchsorted(run['times'], time.time(), side='right'))
+        if done > run['taken']:
+            self._store(run['times'][run['taken']:done], run['values'][run['taken']:done])
+            run['taken'] = done
+        if run['taken'] == len(run['times']):
+            self.run = None
+
+    # readings averaged into each stored reading by the averaging filter, 1 when it is off
+    def _filterCount(self):
+        if self.settings['SENS:AVER:STAT'] in ('ON', '1'):
+            return int(float(self.settings['SENS:AVER:COUN']))
+        return 1
+
+    # turn source values into readings and store them in the trace buffer
+    def _store(self, times, values):
+        source = self.settings['SOUR:FUNC:MODE']
+        numAveraged = self._filterCount()
+        if self.terminal == 'gate':
+            gate = values if source == 'VOLT' else values / self.device.gateLeakage
+            volts = gate
+            amps = self.device.addNoise(gate * self.device.gateLeakage, numAveraged)
+        else:
+            resistance = self.device.resistance(self.device.gateVoltage(times))
+            if source == 'VOLT':
+                volts = values
+                amps = self.device.addNoise(values / resistance, numAveraged)
+            else:
+                amps = values
+                volts = self.device.addNoise(values * resistance, numAveraged)
+        # readings are clamped at compliance
+        currentLimit = float(self.settings['SENS:CURR:PROT'])
+        voltageLimit = float(self.settings['SENS:VOLT:PROT'])
+        amps = numpy.clip(amps, -currentLimit, currentLimit)
+        volts = numpy.clip(volts, -voltageLimit, voltageLimit)
+
+        if 'RES' in self.senseFunctions:
+            ohms = volts / numpy.where(amps == 0, numpy.inf, amps)
+        else:
+            ohms = numpy.ones(len(times)) * NOT_A_NUMBER
+        readings = numpy.column_stack((volts, amps, ohms, times - self.timeOrigin, numpy.zeros(len(times))))
+
+        if self.settings['TRAC:FEED:CONT'] != 'NEXT':
+            return
+        space = int(float(self.settings['TRAC:POIN'])) - len(self.trace)
+        self.trace.extend(readings[:space])
+        if len(self.trace) >= int(float(self.settings['TRAC:POIN'])):
+            self.settings['TRAC:FEED:CONT'] = 'NEV'
+            self.measurementEvents |= BUFFER_FULL
+
+    # the time at which the buffer will fill and SRQ be asserted, None if it never will
+    def _srqTime(self):
+        if self._statusByte() & 64:
+            return time.time()
+        if not (self.measurementEnable & BUFFER_FULL and self.serviceRequestEnable & 1):
+            return None
+        if self.run is None or self.settings['TRAC:FEED:CONT'] != 'NEXT':
+            return None
+        needed = int(float(self.settings['TRAC:POIN'])) - len(self.trace)
+        remaining = self.run['times'][self.run['taken']:]
+        if needed < 1 or needed > len(remaining):
+            return None
+        return remaining[needed - 1]
+
+    # a query for the buffer waits for the running sweep to finish, like the real 2400
+    def _finishRun(self):
+        if self.run is not None:
+            time.sleep(max(0, self.run['times'][-1] - time.time()))
+            self._update()
+
+    # the trace buffer in the current FORMAT:DATA
+    def _traceData(self):
+        self._finishRun()
+        return self._formatValues(numpy.asarray(self.trace, dtype=float).ravel())
+
+    # the CALC3:FORMAT statistic of each column of the trace buffer, as a single reading
+    def _statistic(self):
+        self._finishRun()
+        trace = numpy.asarray(self.trace, dtype=float).reshape(-1, 5)
+        statistic = self.settings['CALC3:FORM']
+        if not len(trace):
+            values = numpy.ones(5) * NOT_A_NUMBER
+        elif statistic == 'SDEV':
+            values = trace.std(axis=0, ddof=1) if len(trace) > 1 else numpy.zeros(5)
+        elif statistic == 'MAX':
+            values = trace.max(axis=0)
+        elif statistic == 'MIN':
+            values = trace.min(axis=0)
+        elif statistic == 'PKPK':
+            values = trace.max(axis=0) - trace.min(axis=0)
+        else:
+            values = trace.mean(axis=0)
+        return self._formatValues(values)
+
+    # values in the current FORMAT:DATA, returned as bytes for REAL formats
+    def _formatValues(self, values):
+        dataFormat = self.settings['FORM:DATA'].replace(' ', '')
+        if dataFormat.startswith('ASC'):
+            return ','.join('%+.6E' % value for value in values)
+        dtype = ('<' if self.settings['FORM:BORD'] == 'SWAP' else '>') + ('f8' if dataFormat.endswith('64') else 'f4')
+        # an indefinite length block, like the real 2400 sends
+        return b'#0' + values.astype(dtype).tobytes() + b'\n'
+
+
+class SimulatedBus(object):
+    """Hands out simulated Keithleys wired to one shared device, use bus.open as a transportFactory.
+
+    The same simulated Keithley is returned every time an address is opened, like real hardware.
+    """
+
+    def __init__(self, device=None, gateAddresses=(DEFAULT_GATE_ADDRESS,), latency=DEFAULT_LATENCY,
+                 integrationTime=DEFAULT_INTEGRATION_TIME):
+        self.device = device if device is not None else SimulatedDevice()
+        self.gateAddresses = gateAddresses
+        self.latency = latency
+        self.integrationTime = integrationTime
+        self.instruments = {}
+
+    # instruments on board 0 are kept under their address, those on other boards under (board, address)
+    def open(self, GPIBaddr, board=0):
+        key = (board, GPIBaddr) if board else GPIBaddr
+        if key not in self.instruments:
+            terminal = 'gate' if GPIBaddr in self.gateAddresses else 'sd'
+            self.instruments[key] = SimulatedKeithley2400(self.device, terminal, self.latency,
+                                                          self.integrationTime)
+        return self.instruments[key]
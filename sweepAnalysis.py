@@ -0,0 +1,150 @@
+# analysis of gate sweeps and IV curves, vectorized over many sweeps at once, i.e.
+# >>> runs = loadGateSweeps(['C:/Data/gateSweep_0001.txt', 'C:/Data/gateSweep_0002.txt'])
+# >>> sweepRate(runs['t'], runs['V_gate'])  # V/s, one per run
+# >>> diracPoint(runs['V_gate'], runs['I_sd'])
+#
+# every function takes arrays of N sweeps x M points (a single sweep can be passed as a 1D array) and
+# returns one value per sweep, so hundreds of runs are handled in one numpy pass. Sweeps of different
+# lengths are padded w/ NaN by stack(), and NaNs are ignored throughout.
+# gate sweeps are assumed to go out and back with the same points, like gateSweep and gateProfile()
+
+import numpy
+
+from columnStore import ColumnReader, STORE_EXTENSION
+
+DEFAULT_GATE_CAPACITANCE = 1.15E-4  # F/m^2, 300 nm of SiO2
+GATE_SWEEP_COLUMNS = ('t', 'V_gate', 'I_sd', 'I_gate')
+GATE_SWEEP_HEADER_LINES = 3  # blank line, column names, units
+
+
+def _sweeps(values):
+    return numpy.atleast_2d(numpy.asarray(values, dtype=float))
+
+
+# stack sweeps of possibly different lengths into one N x M array, padding the short ones w/ NaN
+def stack(sweeps):
+    sweeps = [numpy.asarray(sweep, dtype=float) for sweep in sweeps]
+    stacked = numpy.full((len(sweeps), max(len(sweep) for sweep in sweeps)), numpy.nan)
+    for i, sweep in enumerate(sweeps):
+        stacked[i, :len(sweep)] = sweep
+    return stacked
+
+
+# read saved gate sweeps (text files from gateSweep.saveData or .cols column stores) into a dict of
+# N x M arrays, one per column of GATE_SWEEP_COLUMNS; each sweep appended to a column store is a run of its own
+def loadGateSweeps(paths):
+    columns = dict((name, []) for name in GATE_SWEEP_COLUMNS)
+    for path in paths:
+        if path.endswith(STORE_EXTENSION):
+            store = ColumnReader(path)
+            for i in range(len(store.sweeps)):
+                sweep = store.sweep(i)
+                for name in GATE_SWEEP_COLUMNS:
+                    columns[name].append(sweep[name])
+        else:
+            data = numpy.loadtxt(path, skiprows=GATE_SWEEP_HEADER_LINES, ndmin=2)
+            for i, name in enumerate(GATE_SWEEP_COLUMNS):
+                columns[name].append(data[:, i])
+    return dict((name, stack(values)) for name, values in columns.items())
+
+
+# number of points in each sweep, not counting the NaN padding stack() adds at the end
+def _lengths(values):
+    finite = numpy.isfinite(values)
+    return numpy.where(finite.any(axis=1), values.shape[1] - numpy.argmax(finite[:, ::-1], axis=1), 0)
+
+
+# the forward and return legs of out and back sweeps, the return leg reversed to line up w/ the forward one
+# each sweep is split at its own midpoint, legs of shorter sweeps are padded w/ NaN
+def splitLegs(values):
+    values = _sweeps(values)
+    lengths = _lengths(values)
+    halves = lengths // 2
+    steps = numpy.arange(halves.max())
+    inLeg = steps < halves[:, None]
+    rows = numpy.arange(len(values))[:, None]
+    forward = values[rows, numpy.minimum(steps, values.shape[1] - 1)]
+    back = values[rows, numpy.maximum(lengths[:, None] - 1 - steps, 0)]
+    return numpy.where(inLeg, forward, numpy.nan), numpy.where(inLeg, back, numpy.nan)
+
+
+# least squares slope of y against x for each sweep, ignoring NaNs
+def slope(x, y):
+    x, y = numpy.broadcast_arrays(_sweeps(x), _sweeps(y))
+    valid = numpy.isfinite(x) & numpy.isfinite(y)
+    x = numpy.where(valid, x, numpy.nan)
+    y = numpy.where(valid, y, numpy.nan)
+    dx = x - numpy.nanmean(x, axis=1)[:, None]
+    dy = y - numpy.nanmean(y, axis=1)[:, None]
+    return numpy.nansum(dx * dy, axis=1) / numpy.nansum(dx * dx, axis=1)
+
+
+# sweep rate in V/s from the times and gate voltages of the forward leg
+def sweepRate(t, Vgate):
+    t, Vgate = numpy.broadcast_arrays(_sweeps(t), _sweeps(Vgate))
+    halves = numpy.maximum(_lengths(Vgate) // 2, 2)
+    forward = numpy.arange(Vgate.shape[1]) < halves[:, None]
+    return slope(numpy.where(forward, t, numpy.nan), numpy.where(forward, Vgate, numpy.nan))
+
+
+# resistance V/I point by point, I/V = 0 gives inf
+def resistance(V, I):
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return _sweeps(V) / _sweeps(I)
+
+
+def conductance(V, I):
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return _sweeps(I) / _sweeps(V)
+
+
+# signed area enclosed by the out and back sweep, i.e. the loop integral of y dx; 0 for no hysteresis
+# in V*A for an IV curve, positive when the return leg is above the forward one going up
+def hysteresisArea(x, y):
+    x, y = _sweeps(x), _sweeps(y)
+    segments = 0.5 * (y[:, 1:] + y[:, :-1]) * (x[:, 1:] - x[:, :-1])
+    return -numpy.nansum(segments, axis=1)
+
+
+# gate voltage of the charge neutrality (Dirac) point, where |I_sd| is smallest
+# refined w/ a parabola through the smallest point and its neighbours; legs=True gives (forward, return) per sweep
+def diracPoint(Vgate, Isd, legs=False):
+    if legs:
+        (forwardV, returnV), (forwardI, returnI) = splitLegs(Vgate), splitLegs(Isd)
+        return numpy.column_stack((diracPoint(forwardV, forwardI), diracPoint(returnV, returnI)))
+
+    Vgate, Isd = numpy.broadcast_arrays(_sweeps(Vgate), _sweeps(numpy.abs(Isd)))
+    rows = numpy.arange(len(Isd))
+    i = numpy.nanargmin(numpy.where(numpy.isfinite(Isd), Isd, numpy.inf), axis=1)
+    i = numpy.clip(i, 1, Isd.shape[1] - 2)
+    x0, x1, x2 = Vgate[rows, i - 1], Vgate[rows, i], Vgate[rows, i + 1]
+    y0, y1, y2 = Isd[rows, i - 1], Isd[rows, i], Isd[rows, i + 1]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        # vertex of the parabola through the three points
+        numerator = (x1 - x0) ** 2 * (y1 - y2) - (x1 - x2) ** 2 * (y1 - y0)
+        denominator = (x1 - x0) * (y1 - y2) - (x1 - x2) * (y1 - y0)
+        vertex = x1 - 0.5 * numerator / denominator
+    # fall back to the smallest point if the parabola is flat or its vertex is outside the neighbours
+    inside = numpy.isfinite(vertex) & (vertex >= numpy.minimum(x0, x2)) & (vertex <= numpy.maximum(x0, x2))
+    return numpy.where(inside, vertex, x1)
+
+
+# field effect mobility in cm^2/Vs from the steepest part of I_sd(V_gate), (L/W) * (dI/dVg) / (C * V_sd)
+# capacitance in F/m^2, length and width of the channel in any (the same) units
+def mobility(Vgate, Isd, Vsd, capacitance=DEFAULT_GATE_CAPACITANCE, length=1, width=1):
+    Vgate, Isd = numpy.broadcast_arrays(_sweeps(Vgate), _sweeps(Isd))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        transconductance = numpy.diff(Isd, axis=1) / numpy.diff(Vgate, axis=1)
+    # steps where V_gate doesn't change (the turning point) give inf or NaN
+    transconductance = numpy.where(numpy.isfinite(transconductance), numpy.abs(transconductance), numpy.nan)
+    return 1E4 * (float(length) / width) * numpy.nanmax(transconductance, axis=1) / (capacitance * abs(Vsd))
+
+
+# mean of each group of groupSize consecutive readings, e.g. the sdNumPoints readings taken at each gate voltage
+# a short last group is averaged over the readings it has
+def groupMean(values, groupSize):
+    values = _sweeps(values)
+    numGroups = -(-values.shape[1] // groupSize)  # ceil
+    padded = numpy.full((len(values), numGroups * groupSize), numpy.nan)
+    padded[:, :values.shape[1]] = values
+    return numpy.nanmean(padded.reshape(len(values), numGroups, groupSize), axis=2)